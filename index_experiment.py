@@ -0,0 +1,15 @@
+import argparse
+import os
+
+from utils.manifest import build_manifest
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Writes the manifest (label -> structure and controller paths) of experiments saved without one.')
+    parser.add_argument('experiments', nargs='+', help='names of the experiments, in results/')
+    parser.add_argument('--results-dir', default='results', help='directory of the experiments')
+    args = parser.parse_args()
+
+    for experiment_name in args.experiments:
+        manifest = build_manifest(os.path.join(args.results_dir, experiment_name))
+        print(f'{experiment_name}: {len(manifest)} individuals in {manifest.file_path}')
@@ -1,2 +1,3 @@
 from ppo import arguments
-from ppo.run import run_ppo
\ No newline at end of file
+from ppo.run import run_ppo
+from ppo.run_batch import run_ppo_batch
@@ -1,4 +1,11 @@
 import argparse
+import dataclasses
+import functools
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Optional
+
 import torch
 
 # Derived from
@@ -150,6 +157,16 @@ def get_args():
         action='store_true',
         default=False,
         help='use a recurrent policy')
+    parser.add_argument(
+        '--vec-env',
+        default='subproc',
+        choices=['subproc', 'inprocess'],
+        help='how to run the parallel envs of a robot: subproc (one process per env) | inprocess (all envs stepped in the process of the robot) (default: subproc)')
+    parser.add_argument(
+        '--robots-per-process',
+        type=int,
+        default=1,
+        help='number of robots trained together by each worker, with batched policies (ppo, non recurrent policy only) (default: 1)')
     parser.add_argument(
         '--use-linear-lr-decay',
         action='store_true',
@@ -165,3 +182,82 @@ def get_args():
             'Recurrent policy is not implemented for ACKTR'
 
     return args
+
+
+@dataclass(frozen=True)
+class PPOConfig():
+    """
+    Arguments of a PPO training: same names and defaults as the command line arguments of get_args.
+    Immutable and hashable: built once (get_config, or directly when used as a library), passed to the
+    trainings with their jobs, and varied per individual with replace.
+    """
+    algo: str = 'ppo'
+    gail: bool = False
+    gail_experts_dir: str = './gail_experts'
+    gail_batch_size: int = 128
+    gail_epoch: int = 5
+    lr: float = 2.5e-4
+    eps: float = 1e-5
+    alpha: float = 0.99
+    gamma: float = 0.99
+    use_gae: bool = True
+    gae_lambda: float = 0.95
+    entropy_coef: float = 0.01
+    value_loss_coef: float = 0.5
+    max_grad_norm: float = 0.5
+    seed: int = 1
+    cuda_deterministic: bool = False
+    num_processes: int = 1
+    num_steps: int = 128
+    ppo_epoch: int = 4
+    num_mini_batch: int = 4
+    clip_param: float = 0.1
+    log_interval: int = 10
+    save_interval: int = 100
+    num_evals: int = 1
+    eval_interval: Optional[int] = None
+    num_env_steps: float = 10e6
+    env_name: str = 'roboticgamedesign-v0'
+    log_dir: str = '/tmp/gym/'
+    save_dir: str = './trained_models/'
+    no_cuda: bool = False
+    use_proper_time_limits: bool = False
+    recurrent_policy: bool = False
+    vec_env: str = 'subproc'
+    robots_per_process: int = 1
+    use_linear_lr_decay: bool = True
+    cuda: bool = False      # train on the GPU (get_args: if available, unless --no-cuda)
+
+    def __post_init__(self):
+        assert self.algo in ['a2c', 'ppo', 'acktr']
+        if self.recurrent_policy:
+            assert self.algo in ['a2c', 'ppo'], \
+                'Recurrent policy is not implemented for ACKTR'
+
+    @property
+    def num_updates(self):
+        """Number of updates of a training of num_env_steps environment steps."""
+        return int(self.num_env_steps) // self.num_steps // self.num_processes
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(**vars(args))
+
+    def replace(self, **changes):
+        """Returns a copy of the config with the given arguments changed."""
+        return dataclasses.replace(self, **changes)
+
+    def asdict(self):
+        return dataclasses.asdict(self)
+
+    def digest(self):
+        """Hash of the arguments, stable across processes and runs (unlike hash())."""
+        return hashlib.sha1(json.dumps(self.asdict(), sort_keys=True).encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_config():
+    """
+    Returns the PPOConfig of the command line arguments, parsed once per process.
+    """
+    return PPOConfig.from_args(get_args())
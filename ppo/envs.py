@@ -87,13 +87,16 @@ def make_vec_envs(env_name,
                   log_dir,
                   device,
                   allow_early_resets,
-                  num_frame_stack=None):
+                  num_frame_stack=None,
+                  vec_env='subproc'):
     envs = [
         make_env(env_name, robot_structure, seed, i, log_dir, allow_early_resets)
         for i in range(num_processes)
     ]
 
-    if len(envs) > 1:
+    # inprocess: step all the envs in this process, which is cheaper than the pipe round-trip
+    # to a subprocess for small bodies (parallelism then comes from the robots trained in parallel)
+    if len(envs) > 1 and vec_env == 'subproc':
         envs = SubprocVecEnv(envs)
     else:
         envs = DummyVecEnv(envs)
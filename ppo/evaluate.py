@@ -6,6 +6,37 @@ from ppo.envs import make_vec_envs
 # Derived from
 # https://github.com/ikostrikov/pytorch-a2c-ppo-acktr-gail
 
+def make_eval_envs(num_evals, env_name, robot_structure, seed, num_processes, eval_log_dir, device, vec_env='subproc'):
+    """
+    Creates the envs used by evaluate, which can be passed to successive evaluations instead of building new ones.
+    """
+    num_processes = min(num_processes, num_evals)
+    return make_vec_envs(env_name, robot_structure, seed + num_processes, num_processes,
+                         None, eval_log_dir, device, True, vec_env=vec_env)
+
+
+def load_controller(controller_path, device='cpu'):
+    """
+    Loads the (actor_critic, obs_rms) saved by run_ppo. When torch supports it, the tensors are memory-mapped
+    from the file: the processes evaluating the same controller share its pages instead of holding a copy each.
+    """
+    try:
+        return torch.load(controller_path, map_location=device, mmap=True)
+    except (TypeError, RuntimeError):   # torch without mmap, or file not in the zip format
+        return torch.load(controller_path, map_location=device)
+
+
+def evaluate_saved(controller_path, num_evals, env_name, robot_structure, seed, num_processes, eval_log_dir, device,
+                   no_round=False, eval_envs=None, vec_env='subproc'):
+    """
+    Same as evaluate, for the controller saved at controller_path. It is loaded by the process running the
+    evaluation, so jobs only carry its path instead of the pickled actor_critic and obs_rms.
+    """
+    actor_critic, obs_rms = load_controller(controller_path, device)
+    return evaluate(num_evals, actor_critic, obs_rms, env_name, robot_structure, seed, num_processes, eval_log_dir,
+                    device, no_round, eval_envs, vec_env)
+
+
 def evaluate(
     num_evals, 
     actor_critic, 
@@ -16,12 +47,18 @@ def evaluate(
     num_processes, 
     eval_log_dir,
     device,
-    no_round=False):
+    no_round=False,
+    eval_envs=None,
+    vec_env='subproc'):
 
     num_processes = min(num_processes, num_evals)
     
-    eval_envs = make_vec_envs(env_name, robot_structure, seed + num_processes, num_processes,
-                              None, eval_log_dir, device, True)
+    owns_envs = eval_envs is None
+    if owns_envs:
+        eval_envs = make_eval_envs(num_evals, env_name, robot_structure, seed, num_processes, eval_log_dir, device, vec_env)
+    else:
+        # reseed as a new env would be: reset() below then starts identical episodes
+        eval_envs.seed(seed + num_processes)
 
     vec_norm = utils.get_vec_normalize(eval_envs)
     if vec_norm is not None:
@@ -60,6 +97,7 @@ def evaluate(
                 else:
                     eval_episode_rewards.append(info['episode']['r'])
 
-    eval_envs.close()
+    if owns_envs:
+        eval_envs.close()
 
     return np.mean(eval_episode_rewards)
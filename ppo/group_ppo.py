@@ -39,6 +39,10 @@ class RunData():
     def set_reward(self, reward):
         print(f'setting reward for {self.robot} in {self.env}... {reward}')
         self.reward = reward
+    def set_result(self, result):
+        if not result.ok:
+            print(f'training of {self.robot} in {self.env} failed')
+        self.set_reward(result.value)
 
 def read_robot_from_file(file_name):
     global root_dir
@@ -129,7 +133,7 @@ def run_group_ppo(experiment_name, sim_jobs):
                 np.savez(temp_path, structure[0], structure[1])
 
                 ppo_args = ((structure[0], structure[1]), tc, (save_path_controller, f'{clean_name(robot_name)}_{env_name}'), env_name, True)
-                group.add_job(run_ppo, ppo_args, callback=run_data[-1].set_reward)
+                group.add_job(run_ppo, ppo_args, callback=run_data[-1].set_result)
     group.run_jobs(2)
 
     ### SAVE RANKING TO FILE ##
@@ -7,9 +7,12 @@ from collections import deque
 import torch
 
 from ppo import utils
-from ppo.arguments import get_args
-from ppo.evaluate import evaluate
+from ppo.arguments import get_config
+from ppo.evaluate import evaluate, make_eval_envs
 from ppo.envs import make_vec_envs
+from ppo.warm_start import warm_start as init_from_parent
+from utils.algo_utils import get_stored_structure
+import utils.mp_group as mp
 
 from a2c_ppo_acktr import algo
 from a2c_ppo_acktr.algo import gail
@@ -27,15 +30,26 @@ def run_ppo(
     termination_condition, 
     saving_convention, 
     override_env_name = None,
-    verbose = False):
+    verbose = False,
+    resumable = False,
+    warm_start = None,
+    config = None):
+    """
+    resumable: save the training state when the termination condition is met (train_state.pt, next to the controller),
+    and continue from it if it already exists (envs are reset: the training continues from new episodes)
+    warm_start: path of the controller of another robot (e.g. the parent), with its structure.npz in the same
+    directory, to initialize the policy and observation statistics from (see ppo/warm_start.py)
+    config: PPOConfig of the training (default: the command line arguments, see ppo/arguments.py).
+    The training stops at the termination condition, or after num_env_steps environment steps if that comes first.
+    """
     structure = (ind.structure.body, ind.structure.connections)
     assert (structure == None) == (termination_condition == None) and (structure == None) == (saving_convention == None)
 
     print(f'Starting training on\n{structure[0]}\nat {saving_convention}...\n')
-    args = get_args()
+    args = config if config is not None else get_config()
     
     if override_env_name:
-        args.env_name = override_env_name
+        args = args.replace(env_name=override_env_name)
 
     torch.manual_seed(args.seed)
     torch.cuda.manual_seed_all(args.seed)
@@ -55,7 +69,7 @@ def run_ppo(
     device = torch.device("cuda:0" if args.cuda else "cpu")
 
     envs = make_vec_envs(args.env_name, structure, args.seed, args.num_processes,
-                         args.gamma, args.log_dir, device, False)
+                         args.gamma, args.log_dir, device, False, vec_env=args.vec_env)
 
     actor_critic = Policy(
         envs.observation_space.shape,
@@ -107,6 +121,25 @@ def run_ppo(
             shuffle=True,
             drop_last=drop_last)
 
+    # continue a training stopped by the termination condition (before resetting the envs: their observations
+    # are normalized with the restored statistics)
+    state = None
+    state_path = os.path.join(saving_convention[0], 'train_state.pt') if saving_convention != None else None
+    if resumable and os.path.exists(state_path):
+        state = torch.load(state_path, map_location=device)
+        actor_critic.load_state_dict(state['actor_critic'])
+        agent.optimizer.load_state_dict(state['optimizer'])
+        vec_norm = utils.get_vec_normalize(envs)
+        vec_norm.obs_rms, vec_norm.ret_rms = state['obs_rms'], state['ret_rms']
+    elif warm_start is not None:
+        parent_policy, parent_obs_rms = torch.load(warm_start, map_location=device)
+        parent_structure = get_stored_structure(os.path.join(os.path.dirname(warm_start), 'structure.npz'))
+        num_obs, num_actions = init_from_parent(args.env_name, actor_critic, getattr(utils.get_vec_normalize(envs), 'obs_rms', None),
+                                                structure, parent_policy, parent_obs_rms, parent_structure)
+        mp.report(warm_start=warm_start)
+        if verbose:
+            print(f'Policy initialized from {warm_start} ({num_obs} observations, {num_actions} actions in common)\n')
+
     rollouts = RolloutStorage(args.num_steps, args.num_processes,
                               envs.observation_space.shape, envs.action_space,
                               actor_critic.recurrent_hidden_state_size)
@@ -118,14 +151,31 @@ def run_ppo(
     episode_rewards = deque(maxlen=10)
 
     start = time.time()
-    num_updates = int(args.num_env_steps) // args.num_steps // args.num_processes
+    num_updates = args.num_updates
 
-    rewards_tracker = []
-    avg_rewards_tracker = []
     sliding_window_size = 10
+    rewards_window = utils.RewardWindow(sliding_window_size)
+    avg_rewards_tracker = []
     max_determ_avg_reward = float('-inf')
+    eval_rewards_tracker = []
+    eval_envs = None    # created at the first evaluation, then reused
+
+    start_update = 0
+    if state is not None:
+        episode_rewards.extend(state['episode_rewards'])
+        rewards_window.extend(state['rewards_tracker'][-sliding_window_size:])
+        avg_rewards_tracker = state['avg_rewards_tracker']
+        eval_rewards_tracker, max_determ_avg_reward = state['eval_rewards_tracker'], state['max_determ_avg_reward']
+        start_update = state['updates']
 
-    for j in range(num_updates):
+    def track_episode(reward):
+        episode_rewards.append(reward)
+        rewards_window.append(reward)
+        avg_rewards_tracker.append(rewards_window.mean())
+
+    step_masks = utils.StepMasks(args.num_processes)
+
+    for j in range(start_update, num_updates):
 
         if args.use_linear_lr_decay:
             # decrease learning rate linearly
@@ -143,22 +193,8 @@ def run_ppo(
             # Obser reward and next obs
             obs, reward, done, infos = envs.step(action)        # infos: ({}, {}, {}, {})
 
-            # track rewards
-            for info in infos:
-                if 'episode' in info.keys():        # info.keys:  dict_keys([])
-                    episode_rewards.append(info['episode']['r'])
-                    rewards_tracker.append(info['episode']['r'])
-                    if len(rewards_tracker) < 10:
-                        avg_rewards_tracker.append(np.average(np.array(rewards_tracker)))
-                    else:
-                        avg_rewards_tracker.append(np.average(np.array(rewards_tracker[-10:])))
-
-            # If done then clean the history of observations.
-            masks = torch.FloatTensor(
-                [[0.0] if done_ else [1.0] for done_ in done])
-            bad_masks = torch.FloatTensor(
-                [[0.0] if 'bad_transition' in info.keys() else [1.0]
-                 for info in infos])
+            # track rewards. If done then clean the history of observations.
+            masks, bad_masks = step_masks.update(done, infos, track_episode)
             rollouts.insert(obs, recurrent_hidden_states, action,
                             action_log_prob, value, reward, masks, bad_masks)
 
@@ -208,8 +244,11 @@ def run_ppo(
                 and j % args.eval_interval == 0):
             
             obs_rms = utils.get_vec_normalize(envs).obs_rms
+            if eval_envs is None:
+                eval_envs = make_eval_envs(args.num_evals, args.env_name, structure, args.seed, args.num_processes, eval_log_dir, device, args.vec_env)
             determ_avg_reward = evaluate(args.num_evals, actor_critic, obs_rms, args.env_name, structure, args.seed,
-                     args.num_processes, eval_log_dir, device)
+                     args.num_processes, eval_log_dir, device, eval_envs=eval_envs)
+            eval_rewards_tracker.append(determ_avg_reward)
 
             if verbose:
                 if saving_convention != None:
@@ -231,13 +270,39 @@ def run_ppo(
                     getattr(utils.get_vec_normalize(envs), 'obs_rms', None)
                 ], temp_path)
 
-        # return upon reaching the termination condition
+        # return upon reaching the termination condition (or the end of num_env_steps)
         if not termination_condition == None:
-            if termination_condition(j):
+            if termination_condition(j) or j == num_updates - 1:
                 if verbose:
                     print(f'{saving_convention} has met termination condition ({j})...terminating...\n')
                 ind.structure.reward = max_determ_avg_reward
+                mp.report(train_rewards=avg_rewards_tracker, eval_rewards=eval_rewards_tracker, updates=j+1)
+                if resumable:
+                    vec_norm = utils.get_vec_normalize(envs)
+                    torch.save({
+                        'actor_critic': actor_critic.state_dict(),
+                        'optimizer': agent.optimizer.state_dict(),
+                        'obs_rms': vec_norm.obs_rms,
+                        'ret_rms': vec_norm.ret_rms,
+                        'episode_rewards': list(episode_rewards),
+                        'rewards_tracker': rewards_window.values(),
+                        'avg_rewards_tracker': avg_rewards_tracker,
+                        'eval_rewards_tracker': eval_rewards_tracker,
+                        'max_determ_avg_reward': max_determ_avg_reward,
+                        'updates': j+1,
+                    }, state_path)
+                envs.close()    # pool workers are long-lived: don't leak the env subprocesses
+                if eval_envs is not None:
+                    eval_envs.close()
                 return max_determ_avg_reward
 
+    # no termination condition, or nothing left to train (resumed training already at num_updates)
+    ind.structure.reward = max_determ_avg_reward
+    mp.report(train_rewards=avg_rewards_tracker, eval_rewards=eval_rewards_tracker, updates=max(start_update, num_updates))
+    envs.close()
+    if eval_envs is not None:
+        eval_envs.close()
+    return max_determ_avg_reward
+
 #python ppo_main_test.py --env-name "roboticgamedesign-v0" --algo ppo --use-gae --lr 2.5e-4 --clip-param 0.1 --value-loss-coef 0.5 --num-processes 1 --num-steps 128 --num-mini-batch 4 --log-interval 1 --use-linear-lr-decay --entropy-coef 0.01
 #python ppo.py --env-name "roboticgamedesign-v0" --algo ppo --use-gae --lr 2.5e-4 --clip-param 0.1 --value-loss-coef 0.5 --num-processes 8 --num-steps 128 --num-mini-batch 4 --log-interval 1 --use-linear-lr-decay --entropy-coef 0.01 --log-dir "logs/"
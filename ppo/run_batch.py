@@ -0,0 +1,409 @@
+import os, sys
+sys.path.insert(1, os.path.join(sys.path[0], 'externals', 'pytorch_a2c_ppo_acktr_gail'))
+
+import copy
+import functools
+import numpy as np
+import time
+from collections import deque
+import torch
+import torch.nn as nn
+from gym.spaces.box import Box
+
+from ppo import utils
+from ppo.arguments import get_config
+from ppo.evaluate import evaluate, make_eval_envs
+from ppo.envs import make_vec_envs
+import utils.mp_group as mp
+
+from a2c_ppo_acktr.model import Policy
+from a2c_ppo_acktr.storage import RolloutStorage
+
+import evogym.envs
+
+# Trains several robots at once in one process: same training as run_ppo, with the K policies
+# stacked in batched tensors, so that each forward/backward pass is a few bmm for all the robots.
+
+# layers of the a2c_ppo_acktr MLP Policy
+LAYERS = ['actor_0', 'actor_1', 'critic_0', 'critic_1', 'critic_linear', 'fc_mean']
+
+def _policy_layer(policy, name):
+    return {
+        'actor_0': policy.base.actor[0],
+        'actor_1': policy.base.actor[2],
+        'critic_0': policy.base.critic[0],
+        'critic_1': policy.base.critic[2],
+        'critic_linear': policy.base.critic_linear,
+        'fc_mean': policy.dist.fc_mean,
+    }[name]
+
+
+class BatchedPolicy(nn.Module):
+    """
+    K non recurrent MLP policies with gaussian actions, evaluated at once. The weights of each layer are
+    stacked in a (K, out, in) tensor; observations and actions are zero-padded to the largest robot, and the
+    padded action dimensions are masked out of log probabilities and entropies (their weights stay zero).
+    Inputs have shape (K, batch, max_obs_size).
+    """
+
+    def __init__(self, policies):
+        super(BatchedPolicy, self).__init__()
+        self.templates = [copy.deepcopy(p) for p in policies]     # not submodules: only used by policy()
+        self.obs_sizes = [_policy_layer(p, 'actor_0').in_features for p in policies]
+        self.action_sizes = [_policy_layer(p, 'fc_mean').out_features for p in policies]
+        self.max_obs_size = max(self.obs_sizes)
+        self.max_action_size = max(self.action_sizes)
+
+        self.weights = nn.ParameterDict()
+        self.biases = nn.ParameterDict()
+        for name in LAYERS:
+            layers = [_policy_layer(p, name) for p in policies]
+            out_size = self.max_action_size if name == 'fc_mean' else layers[0].out_features
+            in_size = self.max_obs_size if name in ('actor_0', 'critic_0') else layers[0].in_features
+            weight = torch.zeros(len(policies), out_size, in_size)
+            bias = torch.zeros(len(policies), out_size)
+            for k, layer in enumerate(layers):
+                weight[k, :layer.out_features, :layer.in_features] = layer.weight.data
+                bias[k, :layer.out_features] = layer.bias.data
+            self.weights[name] = nn.Parameter(weight)
+            self.biases[name] = nn.Parameter(bias)
+
+        logstd = torch.zeros(len(policies), self.max_action_size)
+        action_mask = torch.zeros(len(policies), self.max_action_size)
+        for k, p in enumerate(policies):
+            logstd[k, :self.action_sizes[k]] = p.dist.logstd._bias.data.view(-1)
+            action_mask[k, :self.action_sizes[k]] = 1.0
+        self.logstd = nn.Parameter(logstd)
+        self.register_buffer('action_mask', action_mask)
+
+    def __len__(self):
+        return len(self.templates)
+
+    def _linear(self, name, x):
+        return torch.baddbmm(self.biases[name].unsqueeze(1), x, self.weights[name].transpose(1, 2))
+
+    def forward(self, inputs):
+        hidden_critic = torch.tanh(self._linear('critic_1', torch.tanh(self._linear('critic_0', inputs))))
+        hidden_actor = torch.tanh(self._linear('actor_1', torch.tanh(self._linear('actor_0', inputs))))
+        return self._linear('critic_linear', hidden_critic), self._linear('fc_mean', hidden_actor)
+
+    def _dist(self, action_mean):
+        return torch.distributions.Normal(action_mean, self.logstd.exp().unsqueeze(1).expand_as(action_mean))
+
+    def _log_probs(self, dist, actions):
+        return (dist.log_prob(actions) * self.action_mask.unsqueeze(1)).sum(-1, keepdim=True)
+
+    def act(self, inputs, deterministic=False):
+        value, action_mean = self(inputs)
+        dist = self._dist(action_mean)
+        action = action_mean if deterministic else dist.sample()
+        return value, action, self._log_probs(dist, action)
+
+    def get_value(self, inputs):
+        return self(inputs)[0]
+
+    def evaluate_actions(self, inputs, actions):
+        """Returns the values (K, B, 1), log probabilities (K, B, 1) and mean entropy of each policy (K,)."""
+        value, action_mean = self(inputs)
+        dist = self._dist(action_mean)
+        dist_entropy = (dist.entropy() * self.action_mask.unsqueeze(1)).sum(-1).mean(-1)
+        return value, self._log_probs(dist, actions), dist_entropy
+
+    def clip_grad_norm_(self, max_norm):
+        """Same as nn.utils.clip_grad_norm_, for each policy separately."""
+        grads = [p.grad for p in self.parameters() if p.grad is not None]
+        norms = torch.sqrt(sum(g.pow(2).reshape(len(self), -1).sum(1) for g in grads))
+        clip_coef = (max_norm / (norms + 1e-6)).clamp(max=1.0)
+        for g in grads:
+            g.mul_(clip_coef.view(-1, *[1] * (g.dim() - 1)))
+
+    def policy(self, k):
+        """Returns a Policy (same class as the ones trained by run_ppo) with the current weights of policy k."""
+        policy = copy.deepcopy(self.templates[k])
+        for name in LAYERS:
+            layer = _policy_layer(policy, name)
+            layer.weight.data.copy_(self.weights[name].data[k, :layer.out_features, :layer.in_features])
+            layer.bias.data.copy_(self.biases[name].data[k, :layer.out_features])
+        policy.dist.logstd._bias.data.copy_(self.logstd.data[k, :self.action_sizes[k]].view(-1, 1))
+        return policy
+
+
+class BatchedPPO():
+    """
+    a2c_ppo_acktr PPO for a BatchedPolicy: losses, advantage normalization, minibatches and gradient clipping
+    are computed for each policy separately, as K PPO instances would.
+    The rollouts hold the num_processes envs of each robot next to each other (process index k * N + n).
+    """
+
+    def __init__(self, actor_critic, clip_param, ppo_epoch, num_mini_batch, value_loss_coef, entropy_coef,
+                 lr=None, eps=None, max_grad_norm=None, use_clipped_value_loss=True):
+        self.actor_critic = actor_critic
+        self.clip_param = clip_param
+        self.ppo_epoch = ppo_epoch
+        self.num_mini_batch = num_mini_batch
+        self.value_loss_coef = value_loss_coef
+        self.entropy_coef = entropy_coef
+        self.max_grad_norm = max_grad_norm
+        self.use_clipped_value_loss = use_clipped_value_loss
+        self.optimizer = torch.optim.Adam(actor_critic.parameters(), lr=lr, eps=eps)
+
+    def _per_policy(self, x):
+        # (T, K * N, ...) -> (K, T * N, ...), samples of each policy in the order of the flattened (T, N)
+        K = len(self.actor_critic)
+        T, KN = x.shape[:2]
+        x = x.reshape(T, K, KN // K, *x.shape[2:]).transpose(0, 1)
+        return x.reshape(K, T * (KN // K), *x.shape[3:])
+
+    def update(self, rollouts):
+        K = len(self.actor_critic)
+        advantages = self._per_policy(rollouts.returns[:-1] - rollouts.value_preds[:-1])
+        advantages = (advantages - advantages.mean(1, keepdim=True)) / (advantages.std(1, keepdim=True) + 1e-5)
+
+        obs = self._per_policy(rollouts.obs[:-1])
+        actions = self._per_policy(rollouts.actions)
+        value_preds = self._per_policy(rollouts.value_preds[:-1])
+        returns = self._per_policy(rollouts.returns[:-1])
+        old_action_log_probs = self._per_policy(rollouts.action_log_probs)
+
+        batch_size = obs.shape[1]
+        assert batch_size >= self.num_mini_batch, (
+            "PPO requires the number of processes * number of steps ({}) "
+            "to be greater than or equal to the number of PPO mini batches ({}).".format(batch_size, self.num_mini_batch))
+        mini_batch_size = batch_size // self.num_mini_batch
+        rows = torch.arange(K).unsqueeze(1)
+
+        value_loss_epoch = torch.zeros(K)
+        action_loss_epoch = torch.zeros(K)
+        dist_entropy_epoch = torch.zeros(K)
+
+        for e in range(self.ppo_epoch):
+            perms = torch.stack([torch.randperm(batch_size) for _ in range(K)])
+            for start in range(0, batch_size - mini_batch_size + 1, mini_batch_size):
+                indices = (rows, perms[:, start:start + mini_batch_size])
+                values, action_log_probs, dist_entropy = self.actor_critic.evaluate_actions(obs[indices], actions[indices])
+
+                adv_targ = advantages[indices]
+                ratio = torch.exp(action_log_probs - old_action_log_probs[indices])
+                surr1 = ratio * adv_targ
+                surr2 = torch.clamp(ratio, 1.0 - self.clip_param, 1.0 + self.clip_param) * adv_targ
+                action_loss = -torch.min(surr1, surr2).mean((1, 2))
+
+                value_preds_batch, return_batch = value_preds[indices], returns[indices]
+                if self.use_clipped_value_loss:
+                    value_pred_clipped = value_preds_batch + \
+                        (values - value_preds_batch).clamp(-self.clip_param, self.clip_param)
+                    value_losses = (values - return_batch).pow(2)
+                    value_losses_clipped = (value_pred_clipped - return_batch).pow(2)
+                    value_loss = 0.5 * torch.max(value_losses, value_losses_clipped).mean((1, 2))
+                else:
+                    value_loss = 0.5 * (return_batch - values).pow(2).mean((1, 2))
+
+                # the policies don't share parameters: the gradient of the sum is the gradient of each loss
+                self.optimizer.zero_grad()
+                (value_loss * self.value_loss_coef + action_loss - dist_entropy * self.entropy_coef).sum().backward()
+                self.actor_critic.clip_grad_norm_(self.max_grad_norm)
+                self.optimizer.step()
+
+                value_loss_epoch += value_loss.detach()
+                action_loss_epoch += action_loss.detach()
+                dist_entropy_epoch += dist_entropy.detach()
+
+        num_updates = self.ppo_epoch * self.num_mini_batch
+        return value_loss_epoch / num_updates, action_loss_epoch / num_updates, dist_entropy_epoch / num_updates
+
+
+def run_ppo_batch(
+    inds,
+    termination_condition,
+    saving_conventions,
+    override_env_name = None,
+    verbose = False,
+    config = None):
+    """
+    Trains the controllers of several individuals in this process, as run_ppo does for one
+    (ppo, non recurrent policy, without gail). Each robot has its own envs, policy, optimizer state,
+    evaluations and saved controller; only the forward and backward passes are batched.
+    All the individuals are trained with the same config (PPOConfig, default: the command line arguments).
+    Returns the list of the best evaluation reward of each individual, and reports their telemetry
+    in a list ('robots').
+    """
+    structures = [(ind.structure.body, ind.structure.connections) for ind in inds]
+    K = len(inds)
+
+    for structure, saving_convention in zip(structures, saving_conventions):
+        print(f'Starting training on\n{structure[0]}\nat {saving_convention}...\n')
+    args = config if config is not None else get_config()
+    assert args.algo == 'ppo' and not args.recurrent_policy and not args.gail, \
+        'batched training is only implemented for ppo with a non recurrent policy, without gail'
+
+    if override_env_name:
+        args = args.replace(env_name=override_env_name)
+
+    eval_log_dirs = []
+    for saving_convention in saving_conventions:
+        log_dir = os.path.join(saving_convention[0], args.log_dir, "robot_" + str(saving_convention[1]))
+        eval_log_dirs.append(log_dir + "_eval")
+        utils.cleanup_log_dir(log_dir)
+        utils.cleanup_log_dir(eval_log_dirs[-1])
+
+    torch.set_num_threads(1)
+    device = torch.device("cpu")
+
+    envs = [make_vec_envs(args.env_name, structure, args.seed, args.num_processes,
+                          args.gamma, args.log_dir, device, False, vec_env=args.vec_env) for structure in structures]
+
+    # same initial weights as run_ppo
+    policies = []
+    for k in range(K):
+        torch.manual_seed(args.seed)
+        policies.append(Policy(envs[k].observation_space.shape, envs[k].action_space))
+    torch.manual_seed(args.seed)
+
+    actor_critic = BatchedPolicy(policies)
+    agent = BatchedPPO(
+        actor_critic,
+        args.clip_param,
+        args.ppo_epoch,
+        args.num_mini_batch,
+        args.value_loss_coef,
+        args.entropy_coef,
+        lr=args.lr,
+        eps=args.eps,
+        max_grad_norm=args.max_grad_norm)
+
+    N = args.num_processes
+    rollouts = RolloutStorage(args.num_steps, K * N, (actor_critic.max_obs_size,),
+                              Box(-1.0, 1.0, (actor_critic.max_action_size,)), 1)
+
+    obs = torch.zeros(K, N, actor_critic.max_obs_size)   # padded observations of all the robots
+    for k in range(K):
+        obs[k, :, :actor_critic.obs_sizes[k]] = envs[k].reset()
+    rollouts.obs[0].copy_(obs.view(K * N, -1))
+    rollouts_hidden_states = torch.zeros(K * N, 1)       # placeholder: non recurrent policies
+
+    episode_rewards = [deque(maxlen=10) for _ in range(K)]
+    rewards_windows = [utils.RewardWindow(10) for _ in range(K)]
+    avg_rewards_tracker = [[] for _ in range(K)]
+    max_determ_avg_reward = [float('-inf')] * K
+    eval_rewards_tracker = [[] for _ in range(K)]
+    eval_envs = [None] * K
+
+    start = time.time()
+    num_updates = args.num_updates
+
+    def track_episode(k, reward):
+        episode_rewards[k].append(reward)
+        rewards_windows[k].append(reward)
+        avg_rewards_tracker[k].append(rewards_windows[k].mean())
+    track_episodes = [functools.partial(track_episode, k) for k in range(K)]
+
+    # step buffers, refilled in place (rollouts.insert copies them)
+    step_masks = [utils.StepMasks(N) for _ in range(K)]
+    reward = torch.zeros(K, N, 1)
+    masks = torch.ones(K, N, 1)
+    bad_masks = torch.ones(K, N, 1)
+
+    for j in range(num_updates):
+
+        if args.use_linear_lr_decay:
+            # decrease learning rate linearly
+            utils.update_linear_schedule(agent.optimizer, j, num_updates, args.lr)
+
+        for step in range(args.num_steps):
+            # Sample actions
+            with torch.no_grad():
+                value, action, action_log_prob = actor_critic.act(rollouts.obs[step].view(K, N, -1))
+
+            # step the envs of all the robots at the same time, then wait for them
+            for k in range(K):
+                envs[k].step_async(action[k, :, :actor_critic.action_sizes[k]])
+            for k in range(K):
+                obs_k, reward[k], done, infos = envs[k].step_wait()
+                obs[k, :, :actor_critic.obs_sizes[k]] = obs_k
+
+                # track rewards. If done then clean the history of observations.
+                masks_k, bad_masks_k = step_masks[k].update(done, infos, track_episodes[k])
+                masks[k].copy_(masks_k)
+                bad_masks[k].copy_(bad_masks_k)
+
+            rollouts.insert(obs.view(K * N, -1), rollouts_hidden_states, action.view(K * N, -1),
+                            action_log_prob.view(K * N, 1), value.view(K * N, 1), reward.view(K * N, 1),
+                            masks.view(K * N, 1), bad_masks.view(K * N, 1))
+
+        with torch.no_grad():
+            next_value = actor_critic.get_value(rollouts.obs[-1].view(K, N, -1)).view(K * N, 1)
+
+        rollouts.compute_returns(next_value, args.use_gae, args.gamma,
+                                 args.gae_lambda, args.use_proper_time_limits)
+
+        value_loss, action_loss, dist_entropy = agent.update(rollouts)
+
+        rollouts.after_update()
+
+        # print status
+        if j % args.log_interval == 0 and verbose:
+            total_num_steps = (j + 1) * args.num_processes * args.num_steps
+            end = time.time()
+            for k in range(K):
+                if len(episode_rewards[k]) > 1:
+                    print(
+                        "{}: Updates {}, num timesteps {}, FPS {} \n Last {} training episodes: mean/median reward {:.1f}/{:.1f}, min/max reward {:.1f}/{:.1f}\n"
+                            .format(saving_conventions[k][1], j, total_num_steps,
+                                    int(K * total_num_steps / (end - start)),
+                                    len(episode_rewards[k]), np.mean(episode_rewards[k]),
+                                    np.median(episode_rewards[k]), np.min(episode_rewards[k]),
+                                    np.max(episode_rewards[k])))
+
+        # evaluate the controllers and save the ones doing the best so far
+        for k in range(K):
+            if not (args.eval_interval is not None and len(episode_rewards[k]) > 1
+                    and j % args.eval_interval == 0):
+                continue
+
+            policy = actor_critic.policy(k)
+            obs_rms = utils.get_vec_normalize(envs[k]).obs_rms
+            if eval_envs[k] is None:
+                eval_envs[k] = make_eval_envs(args.num_evals, args.env_name, structures[k], args.seed, args.num_processes, eval_log_dirs[k], device, args.vec_env)
+            determ_avg_reward = evaluate(args.num_evals, policy, obs_rms, args.env_name, structures[k], args.seed,
+                     args.num_processes, eval_log_dirs[k], device, eval_envs=eval_envs[k])
+            eval_rewards_tracker[k].append(determ_avg_reward)
+
+            if verbose:
+                print(f'Evaluated {saving_conventions[k][1]} using {args.num_evals} episodes. Mean reward: {np.mean(determ_avg_reward)}\n')
+
+            if determ_avg_reward > max_determ_avg_reward[k]:
+                max_determ_avg_reward[k] = determ_avg_reward
+
+                temp_path = os.path.join(saving_conventions[k][0], "controller" + ".pt")
+                if verbose:
+                    print(f'Saving {temp_path} with avg reward {max_determ_avg_reward[k]}\n')
+                torch.save([
+                    policy,
+                    getattr(utils.get_vec_normalize(envs[k]), 'obs_rms', None)
+                ], temp_path)
+
+        # return upon reaching the termination condition (or the end of num_env_steps)
+        if not termination_condition == None:
+            if termination_condition(j) or j == num_updates - 1:
+                if verbose:
+                    print(f'{[s[1] for s in saving_conventions]} have met termination condition ({j})...terminating...\n')
+                for k in range(K):
+                    inds[k].structure.reward = max_determ_avg_reward[k]
+                mp.report(robots=[{'train_rewards': avg_rewards_tracker[k], 'eval_rewards': eval_rewards_tracker[k], 'updates': j+1}
+                                  for k in range(K)])
+                for k in range(K):
+                    envs[k].close()     # pool workers are long-lived: don't leak the env subprocesses
+                    if eval_envs[k] is not None:
+                        eval_envs[k].close()
+                return max_determ_avg_reward
+
+    # no termination condition, or no update to run
+    for k in range(K):
+        inds[k].structure.reward = max_determ_avg_reward[k]
+    mp.report(robots=[{'train_rewards': avg_rewards_tracker[k], 'eval_rewards': eval_rewards_tracker[k], 'updates': num_updates}
+                      for k in range(K)])
+    for k in range(K):
+        envs[k].close()
+        if eval_envs[k] is not None:
+            eval_envs[k].close()
+    return max_determ_avg_reward
@@ -1,6 +1,7 @@
 import glob
 import os
 
+import numpy as np
 import torch
 import torch.nn as nn
 
@@ -30,6 +31,62 @@ def get_vec_normalize(venv):
     return None
 
 
+class RewardWindow():
+    """
+    Ring buffer of the last size episode rewards, for their sliding average.
+    """
+
+    def __init__(self, size=10):
+        self.buffer = np.zeros(size)
+        self.count = 0      # rewards appended so far
+
+    def append(self, reward):
+        self.buffer[self.count % len(self.buffer)] = reward
+        self.count += 1
+
+    def extend(self, rewards):
+        for reward in rewards:
+            self.append(reward)
+
+    def mean(self):
+        return self.buffer[:min(self.count, len(self.buffer))].mean()
+
+    def values(self):
+        """Returns the rewards in the window, oldest first."""
+        if self.count <= len(self.buffer):
+            return self.buffer[:self.count].tolist()
+        start = self.count % len(self.buffer)
+        return np.concatenate([self.buffer[start:], self.buffer[:start]]).tolist()
+
+
+class StepMasks():
+    """
+    Preallocated masks and bad_masks (num_envs, 1) of the rollouts, refilled in place at every step.
+    """
+
+    def __init__(self, num_envs):
+        self.masks = torch.ones(num_envs, 1)
+        self.bad_masks = torch.ones(num_envs, 1)
+        self._masks = self.masks.numpy()[:, 0]      # views sharing the memory of the tensors
+        self._bad_masks = self.bad_masks.numpy()[:, 0]
+
+    def update(self, done, infos, on_episode=None):
+        """
+        Sets the masks of the step: 0 for the envs that are done, and in bad_masks 0 for the bad transitions
+        (episodes ended by the time limit). on_episode is called with the reward of each episode finished at this step.
+        Returns (masks, bad_masks).
+        """
+        np.logical_not(done, out=self._masks)
+        self._bad_masks.fill(1.0)
+        for i, info in enumerate(infos):
+            if info:    # empty for most steps
+                if 'bad_transition' in info:
+                    self._bad_masks[i] = 0.0
+                if on_episode is not None and 'episode' in info:
+                    on_episode(info['episode']['r'])
+        return self.masks, self.bad_masks
+
+
 # Necessary for my KFAC implementation.
 class AddBias(nn.Module):
     def __init__(self, bias):
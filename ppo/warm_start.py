@@ -0,0 +1,98 @@
+import numpy as np
+import torch
+import gym
+
+import evogym.envs
+
+# Initialization of the policy of a robot from the trained policy of another one (e.g. its parent):
+# the weights of the observations and actions the two robots have in common are copied, the others
+# keep their random initialization.
+
+
+def robot_points(env_name, structure):
+    """
+    Returns the initial positions (2, n) of the point masses of the robot in env_name, in the order of its observations.
+    """
+    env = gym.make(env_name, body=structure[0], connections=structure[1])
+    env.reset()
+    points = env.unwrapped.object_pos_at_time(env.unwrapped.get_time(), 'robot')
+    env.close()
+    return points
+
+
+def observation_map(parent_points, child_points, parent_obs_size, child_obs_size):
+    """
+    Returns the indexes (child, parent) of the observations of the child that have a counterpart in the observations of the parent.
+    The observations are assumed to be laid out as in the locomotion tasks: velocity of the center of mass (2),
+    positions of the n point masses relative to it (n x, then n y), then the observations of the task, the same for both robots.
+    Point masses are matched by their initial position.
+    """
+    n_parent, n_child = parent_points.shape[1], child_points.shape[1]
+    extra = parent_obs_size - 2 - 2 * n_parent
+    if extra < 0 or extra != child_obs_size - 2 - 2 * n_child:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)     # unknown layout: nothing in common
+
+    parent_index = {tuple(p): i for i, p in enumerate(np.round(parent_points.T, 3))}
+    matches = [(i, parent_index[tuple(p)]) for i, p in enumerate(np.round(child_points.T, 3)) if tuple(p) in parent_index]
+    child_points_idx = np.array([i for i, _ in matches], dtype=int)
+    parent_points_idx = np.array([j for _, j in matches], dtype=int)
+
+    child_idx = np.concatenate([[0, 1], 2 + child_points_idx, 2 + n_child + child_points_idx, 2 + 2 * n_child + np.arange(extra)])
+    parent_idx = np.concatenate([[0, 1], 2 + parent_points_idx, 2 + n_parent + parent_points_idx, 2 + 2 * n_parent + np.arange(extra)])
+    return child_idx.astype(int), parent_idx.astype(int)
+
+
+def action_map(parent_body, child_body):
+    """
+    Returns the indexes (child, parent) of the actuators of the child that are at the same place in the parent body
+    (actuators are numbered in the row-major order of the body).
+    """
+    def actuators(body):
+        voxels = np.argwhere(np.isin(np.asarray(body), (3, 4)))
+        return {tuple(v): i for i, v in enumerate(voxels)}
+    parent_actuators, child_actuators = actuators(parent_body), actuators(child_body)
+    matches = [(i, parent_actuators[v]) for v, i in child_actuators.items() if v in parent_actuators]
+    return np.array([i for i, _ in matches], dtype=int), np.array([j for _, j in matches], dtype=int)
+
+
+def warm_start_policy(policy, parent_policy, obs_idx, action_idx):
+    """
+    Copies the weights of parent_policy (a2c_ppo_acktr MLP Policy) into policy: the hidden layers entirely,
+    the input columns of the observations in obs_idx and the outputs of the actions in action_idx
+    (pairs of index arrays (child, parent), see observation_map and action_map).
+    """
+    (obs_child, obs_parent), (act_child, act_parent) = obs_idx, action_idx
+    with torch.no_grad():
+        for name in ('actor', 'critic'):
+            layers, parent_layers = getattr(policy.base, name), getattr(parent_policy.base, name)
+            layers[0].weight[:, obs_child] = parent_layers[0].weight[:, obs_parent]
+            layers[0].bias.copy_(parent_layers[0].bias)
+            layers[2].load_state_dict(parent_layers[2].state_dict())
+        policy.base.critic_linear.load_state_dict(parent_policy.base.critic_linear.state_dict())
+        policy.dist.fc_mean.weight[act_child] = parent_policy.dist.fc_mean.weight[act_parent]
+        policy.dist.fc_mean.bias[act_child] = parent_policy.dist.fc_mean.bias[act_parent]
+        policy.dist.logstd._bias[act_child] = parent_policy.dist.logstd._bias[act_parent]
+    return policy
+
+
+def warm_start_obs_rms(obs_rms, parent_obs_rms, obs_idx):
+    """Copies the observation statistics of the parent for the observations in obs_idx."""
+    obs_child, obs_parent = obs_idx
+    obs_rms.mean[obs_child] = parent_obs_rms.mean[obs_parent]
+    obs_rms.var[obs_child] = parent_obs_rms.var[obs_parent]
+    obs_rms.count = parent_obs_rms.count
+    return obs_rms
+
+
+def warm_start(env_name, policy, obs_rms, structure, parent_policy, parent_obs_rms, parent_structure):
+    """
+    Initializes the policy and observation statistics of the robot structure from those trained for parent_structure.
+    Returns the number of observations and actions copied.
+    """
+    obs_idx = observation_map(robot_points(env_name, parent_structure), robot_points(env_name, structure),
+                              parent_policy.base.actor[0].in_features, policy.base.actor[0].in_features)
+    action_idx = action_map(parent_structure[0], structure[0])
+    warm_start_policy(policy, parent_policy, obs_idx, action_idx)
+    if obs_rms is not None and parent_obs_rms is not None:
+        warm_start_obs_rms(obs_rms, parent_obs_rms, obs_idx)
+    return len(obs_idx[0]), len(action_idx[0])
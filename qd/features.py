@@ -1,126 +1,209 @@
 import numpy as np
-from copy import deepcopy
 import math
+import threading
 import warnings
+from collections import OrderedDict
 
-### FITNESS COMPUTATION FUNCTIONS ###
-def compute_length(structure):
-    coordinates = []
-    for i in range(structure.shape[0]):
-        for j in range(structure.shape[1]):
-            if structure.body[i][j] != 0:
-                coordinates.append([i, j])
-    
-    minL, maxL = range_y(coordinates)
-    length = maxL - minL + 1
-    return length
+from evogym import hashable
 
+# Descriptors are computed on stacks of bodies of shape (N, H, W), all at once.
+# The compute_* functions on a single structure are kept for convenience and give the same values.
 
-def compute_height(structure):
-    coordinates = []
-    for i in range(structure.shape[0]):
-        for j in range(structure.shape[1]):
-            if structure.body[i][j] != 0:
-                coordinates.append([i, j])
-    minH, maxH = range_x(coordinates)
-    height = maxH - minH + 1
-    return height
+def stack_bodies(structures):
+    return np.stack([np.asarray(s.body) for s in structures])
 
 
-def compute_base_length(structure):
-    baseLength = len(np.nonzero(structure.body[len(structure.body)-1])[0])
-    return baseLength
+### BATCH COMPUTATION FUNCTIONS ###
+def _bounding_box(mask, axis):
+    # min and max index of the non empty voxels along axis (1: rows, 2: columns)
+    filled = mask.any(axis=3-axis)
+    idx = np.arange(filled.shape[1])
+    min_idx = np.where(filled, idx, filled.shape[1]).min(axis=1)
+    max_idx = np.where(filled, idx, -1).max(axis=1)
+    return min_idx, max_idx
 
 
-def compute_emptiness(structure):
-    emptiness = (structure.body == 0).sum() / (structure.shape[0] * structure.shape[1])
-    return emptiness
+def batch_length(bodies):
+    minL, maxL = _bounding_box(bodies != 0, axis=2)
+    return maxL - minL + 1
 
 
-# VOXEL_TYPES = { 'EMPTY': 0, 'RIGID': 1, 'SOFT': 2, 'H_ACT': 3, 'V_ACT': 4, 'FIXED': 5} (see evogym/utils.py)
-def compute_actuation(structure):
-    body = np.asarray(structure.body)
+def batch_height(bodies):
+    minH, maxH = _bounding_box(bodies != 0, axis=1)
+    return maxH - minH + 1
+
+
+def batch_base_length(bodies):
+    return (bodies[:, -1, :] != 0).sum(axis=1)
 
-    v_total = (body > 0).sum()
-    v_actuation = (body == 3).sum() / v_total
-    h_actuation = (body == 4).sum() / v_total
-    actuation = v_actuation + h_actuation
 
+def batch_emptiness(bodies):
+    return (bodies == 0).sum(axis=(1, 2)) / (bodies.shape[1] * bodies.shape[2])
+
+
+# VOXEL_TYPES = { 'EMPTY': 0, 'RIGID': 1, 'SOFT': 2, 'H_ACT': 3, 'V_ACT': 4, 'FIXED': 5} (see evogym/utils.py)
+def batch_actuation(bodies):
+    v_total = (bodies > 0).sum(axis=(1, 2))
+    v_actuation = (bodies == 3).sum(axis=(1, 2)) / v_total
+    h_actuation = (bodies == 4).sum(axis=(1, 2)) / v_total
+    actuation = v_actuation + h_actuation
     return actuation, v_actuation, h_actuation
 
 
-def compute_compactness(structure):
-    # approximate convex hull
-    convexHull = deepcopy(structure.body)
-    shape = structure.shape
-
-    # loop as long as there are empty cells have at least five of the eight Moore neighbors as true
-    none = False
-    while not none:
-        none = True
-        for i in range(shape[0]):
-            for j in range(shape[1]):
-                if convexHull[i][j]==0:     # empty voxel found
-                    adjacentCount = 0
-                    # count not empty Moore neighbors
-                    for a in [-1, 0, 1]:
-                        for b in [-1, 0, 1]:
-                            i_neigh = i+a if (i+a > 0 and i+a < shape[0]) else -1
-                            j_neigh = j+b if (j+b > 0 and j+b < shape[1]) else -1
-                            if not (a == 0 and b == 0) and i_neigh>=0 and j_neigh>=0 and convexHull[i_neigh][j_neigh]>0:
-                                adjacentCount += 1
-                                
-                    # if at least five, fill the cell (with -1, nonzero value)
-                    if adjacentCount >= 5:
-                        convexHull[i][j] = -1
-                        none = False
-
-    nVoxels = len(np.nonzero(structure.body)[0])            # non empty voxels in body
-    nConvexHull = len(np.matrix.nonzero(convexHull)[0])     # non empty voxels in convex hull
+def _moore_count(mask):
+    # number of true Moore neighbors of each cell (3x3 convolution without the center)
+    n, h, w = mask.shape
+    padded = np.zeros((n, h+2, w+2), dtype=np.int64)
+    padded[:, 1:-1, 1:-1] = mask
+    count = np.zeros((n, h, w), dtype=np.int64)
+    for a in [-1, 0, 1]:
+        for b in [-1, 0, 1]:
+            if not (a == 0 and b == 0):
+                count += padded[:, 1+a:h+1+a, 1+b:w+1+b]
+    return count
+
+
+def batch_compactness(bodies):
+    # approximate convex hull: fill the empty cells with at least five of the eight Moore neighbors not empty.
+    # Filled cells don't count as neighbors, so one pass reaches the fixed point.
+    # As in the original scan, neighbors in the first row and column are not counted.
+    neighbors = bodies > 0
+    neighbors[:, 0, :] = False
+    neighbors[:, :, 0] = False
+    filled = (bodies == 0) & (_moore_count(neighbors) >= 5)
+
+    nVoxels = (bodies != 0).sum(axis=(1, 2))                # non empty voxels in body
+    nConvexHull = nVoxels + filled.sum(axis=(1, 2))         # non empty voxels in convex hull
     return nVoxels / nConvexHull    # -> 0.0 for less compact shapes, -> 1.0 for more compact shapes
 
 
-def compute_elongation(structure, n_dir):
+def batch_elongation(bodies, n_dir):
     if n_dir < 0:
         warnings.warn(UserWarning("n_dir shoud be a non negative number"))
 
+    mask = bodies != 0
+    x, y = np.indices(bodies.shape[1:])
     diameters = []
-    coordinates = []
-    for i in range(structure.shape[0]):
-        for j in range(structure.shape[1]):
-            if structure.body[i][j] != 0:
-                coordinates.append([i, j])
-
     for i in range(n_dir):
         theta = (2 * i * math.pi) / n_dir
-        rotated_coordinates = []
-        
-        for p in coordinates:
-            x = p[0]
-            y = p[1]
-            new_x = round( x * math.cos(theta) - y * math.sin(theta) )
-            new_y = round( x * math.sin(theta) + y * math.cos(theta) )
-            rotated_coordinates.append([new_x, new_y])
-
-        minX, maxX = range_x(rotated_coordinates)
-        minY, maxY = range_y(rotated_coordinates)
-        sideX = maxX - minX +1
-        sideY = maxY - minY +1
-        diameters.append( min(sideX, sideY) / max(sideX, sideY) )
-
-    return 1 - min(diameters)
-
-def range_x(coordinates):
-    coordinates = np.array(coordinates)
-    sorted = np.argsort(coordinates[:,0])
-    min_x = coordinates[sorted[0],:][0]
-    max_x = coordinates[sorted[-1],:][0]
-    return min_x, max_x
-
-def range_y(coordinates):
-    coordinates = np.array(coordinates)
-    sorted = np.argsort(coordinates[:,1])
-    min_y = coordinates[sorted[0],:][1]
-    max_y = coordinates[sorted[-1],:][1]
-    return min_y, max_y
+        # rotated coordinates of every cell (round half to even, as python round)
+        new_x = np.rint(x * math.cos(theta) - y * math.sin(theta))
+        new_y = np.rint(x * math.sin(theta) + y * math.cos(theta))
+
+        sideX = np.where(mask, new_x, -np.inf).max(axis=(1, 2)) - np.where(mask, new_x, np.inf).min(axis=(1, 2)) + 1
+        sideY = np.where(mask, new_y, -np.inf).max(axis=(1, 2)) - np.where(mask, new_y, np.inf).min(axis=(1, 2)) + 1
+        diameters.append( np.minimum(sideX, sideY) / np.maximum(sideX, sideY) )
+
+    return 1 - np.min(diameters, axis=0)
+
+
+# descriptor name -> batch function of the stack of bodies
+DESCRIPTORS = {
+        "length": batch_length,
+        "height": batch_height,
+        "baseLength": batch_base_length,
+        "emptiness": batch_emptiness,
+        "compactness": batch_compactness,
+        "elongation": lambda bodies: batch_elongation(bodies, 2),
+        "actuation": lambda bodies: batch_actuation(bodies)[0],
+        "verticalActuation": lambda bodies: batch_actuation(bodies)[1],
+        "horizontalActuation": lambda bodies: batch_actuation(bodies)[2]
+}
+
+
+def compute_batch_descriptors(bodies, names=None):
+    """
+    Computes the morphology descriptors in names (default: all of them) of a stack of bodies (N, H, W).
+    Returns a dict: descriptor name -> array of N values.
+    """
+    bodies = np.asarray(bodies)
+    names = DESCRIPTORS.keys() if names is None else names
+    return {name: DESCRIPTORS[name](bodies) for name in names}
+
+
+class DescriptorCache():
+    """
+    Bounded LRU cache of the descriptors, keyed by body hash and descriptor name.
+    Only the descriptors not already in the cache are computed, in a single batch.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, bodies, names):
+        """
+        Returns the descriptors in names of each body, as a list of dicts: descriptor name -> value.
+        """
+        with self._lock:
+            return self._get(bodies, names)
+
+    def _get(self, bodies, names):
+        keys = [(np.shape(body), hashable(body)) for body in bodies]
+        results = [{} for _ in bodies]
+        missing = OrderedDict()     # body index -> missing descriptor names
+
+        for i, key in enumerate(keys):
+            for name in names:
+                if (key, name) in self.values:
+                    self.values.move_to_end((key, name))
+                    results[i][name] = self.values[(key, name)]
+                    self.hits += 1
+                else:
+                    missing.setdefault(i, []).append(name)
+                    self.misses += 1
+
+        if len(missing) > 0:
+            idx = list(missing.keys())
+            missing_names = [name for name in names if any(name in missing[i] for i in idx)]
+            descriptors = compute_batch_descriptors(np.stack([np.asarray(bodies[i]) for i in idx]), missing_names)
+            for k, i in enumerate(idx):
+                for name in missing[i]:
+                    results[i][name] = descriptors[name][k]
+                    self.values[(keys[i], name)] = descriptors[name][k]
+
+            while len(self.values) > self.max_size:
+                self.values.popitem(last=False)
+
+        return results
+
+    def clear(self):
+        self.values.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+### FITNESS COMPUTATION FUNCTIONS ###
+def compute_length(structure):
+    return batch_length(stack_bodies([structure]))[0]
+
+
+def compute_height(structure):
+    return batch_height(stack_bodies([structure]))[0]
 
+
+def compute_base_length(structure):
+    return batch_base_length(stack_bodies([structure]))[0]
+
+
+def compute_emptiness(structure):
+    return batch_emptiness(stack_bodies([structure]))[0]
+
+
+def compute_actuation(structure):
+    actuation, v_actuation, h_actuation = batch_actuation(stack_bodies([structure]))
+    return actuation[0], v_actuation[0], h_actuation[0]
+
+
+def compute_compactness(structure):
+    return batch_compactness(stack_bodies([structure]))[0]
+
+
+def compute_elongation(structure, n_dir):
+    return batch_elongation(stack_bodies([structure]), n_dir)[0]
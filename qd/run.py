@@ -3,11 +3,15 @@ import shutil
 from unittest import result
 import warnings
 import traceback
+import numpy as np
 
 from torch import from_dlpack
 
 from qdpy.experiment import QDExperiment
-from qd.sim import compute_features, make_env, simulate, evaluate_ind
+from utils.eval_store import EvalStore
+from utils.results_store import ResultsStore
+from qd.sim import compute_batch_features, make_env, simulate, evaluate_ind, descriptor_cache
+from ppo.arguments import get_config
 
 import time
 
@@ -27,20 +31,37 @@ class EvoGymExperiment(QDExperiment):
         self.env_name = self.config['env_name']
         self.shape = self.config['algorithms']['shape']
         self.population_structure_hashes = {}
+        if self.config.get('successive_halving') and self.async_mode:
+            # asynchronous evaluations are one individual at a time: there would be no cohort to halve
+            raise ValueError("successive_halving needs batch evaluations: it cannot be used with async_mode")
+        if self.config.get('eval_cache'):
+            self.eval_store = EvalStore(self.config['eval_cache'])
+        elif self.checkpoint_period > 0:
+            # trainings finished after the last checkpoint are reused when resuming
+            self.eval_store = EvalStore(os.path.join(self.config['dataDir'], 'eval_store'))
+        else:
+            self.eval_store = None
+        # PPO arguments of the trainings: the command line ones, with the changes of the configuration file
+        self.ppo_config = get_config().replace(**(self.config.get('ppo') or {}))
+
+    def ppo_overrides(self, ind):
+        """PPO arguments changed for the training of ind: num_env_steps proportional to its number of voxels."""
+        return {'num_env_steps': self.config['env_steps_per_voxel'] * int(np.count_nonzero(ind.structure.body))}
 
     def eval_fn(self, individuals):
         
+        compute_batch_features(individuals, self.features_list)
         for ind in individuals:
-            compute_features(ind, self.features_list)
             make_env(env_name = self.env_name, ind=ind)
 
         if self.reoptimize != '' and not self.reoptimize:
             evaluate_ind(self.env_name, individuals, self.structure_from, from_labels=self.from_labels, num_cores=self.num_cores)
         else:
-            simulate(self.env_name, individuals, self.experiment_name, self.config[('indv_eps')], num_cores=self.num_cores)  #compute fitness
+            simulate(self.env_name, individuals, self.experiment_name, self.config[('indv_eps')], num_cores=self.num_cores, eval_store=self.eval_store, halving=self.config.get('successive_halving'), warm_start=self.config.get('warm_start', False),
+                     ppo_config=self.ppo_config, ppo_overrides=self.ppo_overrides if self.config.get('env_steps_per_voxel') else None)  #compute fitness
         
         ## STORE RESULTS
-        store_results(path=self.save_path, individuals=individuals)
+        store_results(path=self.save_path, individuals=individuals, features_list=self.features_list)
         return individuals
 
 
@@ -55,6 +76,8 @@ def create_experiment(experiment_name, configFileName, parallelismType, base_con
     exp = EvoGymExperiment(configFileName, parallelismType, seed=None, base_config=base_config) #seed defined in conf file
     exp.experiment_name = experiment_name
     exp.num_cores = num_cores
+    if exp.max_in_flight is None:
+        exp.max_in_flight = num_cores       # async mode: one evaluation per core
     exp.save_path = save_path
     print("Using configuration file '%s'. Instance name: '%s'" % (configFileName, exp.instance_name))
     return exp
@@ -90,12 +113,8 @@ def store_metadata(exp, save_path):
 
     f.close()
 
-def store_results(path, individuals):
-    test_path = os.path.join(path, "results.csv")
-    f_csv = open(test_path, "a")
-    for ind in individuals:
-        f_csv.write(f"ind{ind.structure.label};generation{ind.structure.generation};{ind.features};{ind.fitness[0]}\n")
-    f_csv.close()
+def store_results(path, individuals, features_list):
+    ResultsStore(path).append(individuals, features_list)
 
 
 ###### RUN EXPERIMENT ######
@@ -128,8 +147,42 @@ def run_qd(experiment_name, configFileName, parallelismType, num_cores=4):
 
         launch_experiment(exp)
 
-        print("\n-------", time.time()-start_time, "-----\n")   # tmp: keep track of total execution time
+        print_run_stats(exp, start_time)
+
+    except Exception as e:
+        warnings.warn(f"Run failed: {str(e)}")
+        traceback.print_exc()
+
+
+def resume_qd(experiment_name, configFileName, parallelismType, num_cores=4):
+    """
+    Continues an interrupted run of run_qd (same arguments) from its last checkpoint.
+    """
+    print()
+
+    save_path = os.path.join(root_dir, 'results', experiment_name)
+    if not os.path.exists(save_path):
+        print(f'THIS EXPERIMENT ({experiment_name}) DOES NOT EXIST')
+        return
+
+    base_config = create_base_config(save_path)
+    try:
+        exp = create_experiment(experiment_name, configFileName, parallelismType, base_config, num_cores, save_path)
+
+        start_time = time.time()    # tmp: start timer
+
+        print()
+        exp.resume()
+
+        print_run_stats(exp, start_time)
 
     except Exception as e:
         warnings.warn(f"Run failed: {str(e)}")
         traceback.print_exc()
+
+
+def print_run_stats(exp, start_time):
+    print("\n-------", time.time()-start_time, "-----\n")   # tmp: keep track of total execution time
+    print(f"Descriptor cache: {descriptor_cache.hits} hits, {descriptor_cache.misses} misses\n")
+    if exp.eval_store is not None:
+        print(f"Evaluation store: {exp.eval_store.hits} hits, {exp.eval_store.misses} misses\n")
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import os
+import hashlib
+import shutil
 import numpy as np
 import warnings
 
@@ -11,7 +13,8 @@ from evogym.envs.jump import StationaryJump
 from evogym.envs.balance import Balance, BalanceJump
 from evogym.envs.traverse import StepsUp, StepsDown, WalkingBumpy, WalkingBumpy2, VerticalBarrier, FloatingPlatform, Gaps, BlockSoup
 from evogym.envs.manipulate import CarrySmallRect, CarrySmallRectToTable, PushSmallRect, PushSmallRectOnOppositeSide, ThrowSmallRect, CatchSmallRect, ToppleBeam, SlideBeam, LiftSmallRect
-from utils.algo_utils import TerminationCondition
+from utils.algo_utils import TerminationCondition, get_ind_path
+from utils.manifest import get_manifest
 import utils.mp_group as mp
 
 from qd.features import *
@@ -23,20 +26,38 @@ external_dir = os.path.join(root_dir, 'externals')
 sys.path.insert(0, root_dir)
 sys.path.insert(1, os.path.join(external_dir, 'PyTorch-NEAT'))
 sys.path.insert(1, os.path.join(external_dir, 'pytorch_a2c_ppo_acktr_gail'))
-from ppo import run_ppo
+from ppo import run_ppo, run_ppo_batch
 
 from ppo.envs import make_vec_envs
-from ppo.evaluate import evaluate
+from ppo.evaluate import evaluate_saved
+from ppo.arguments import get_config
 from ppo import utils
 
 ###### SIMULATION FUNCTIONS ######
 
-def simulate(env_name, inds, experiment_name, num_episode=5, num_cores=4):
+def simulate(env_name, inds, experiment_name, num_episode=5, num_cores=4, eval_store=None, halving=None, warm_start=False,
+             ppo_config=None, ppo_overrides=None):
+    """
+    Trains the controllers of inds and sets their fitness.
+    halving: if given (dict with min_iters and optionally eta), the individuals are trained with successive halving
+    (see successive_halving) instead of all getting num_episode training iterations.
+    warm_start: if True, the policies of mutated individuals are initialized from the controller of their parent
+    (see ppo/warm_start.py), trained in the same experiment.
+    ppo_config: PPOConfig of the trainings (default: the command line arguments).
+    ppo_overrides: function of an individual returning the PPO arguments to change for its training (dict), e.g.
+    a num_env_steps depending on its body.
+    """
 
     ## DEFINE TERMINATION CONDITION
     tc = TerminationCondition(num_episode)
 
+    if ppo_config is None:
+        ppo_config = get_config()
+
+    manifest = get_manifest(os.path.join(root_dir, "results", experiment_name))
+
     group = mp.Group()
+    to_train = []   # (ind, save_path, callback, parent controller to start from, PPOConfig)
     for ind in inds:
         ## RESULT DIR
         save_path = os.path.join(root_dir, "results", experiment_name, "generation_" + str(ind.structure.generation), "ind" + str(ind.structure.label))    # evaluated ind dir
@@ -47,11 +68,67 @@ def simulate(env_name, inds, experiment_name, num_episode=5, num_cores=4):
         
         file_path = os.path.join(save_path, "structure")
         np.savez(file_path, ind.structure.body, ind.structure.connections)
-
-        ## COMPUTE FITNESS: RUN PPO OR GROUP JOBS
-        #ind.structure.reward = run_ppo(structure=(ind.structure.body, ind.structure.connections), termination_condition=tc, saving_convention=(save_path, ind.structure.label), verbose=False)
-        ppo_args = (ind, tc, (save_path, ind.structure.label), env_name, False)
-        group.add_job(run_ppo, ppo_args, callback=ind.set_fitness)
+        manifest.add(ind.structure.label, ind.structure.generation, save_path)
+
+        parent_controller = None
+        if warm_start and getattr(ind.structure, 'parent_label', -1) >= 0:
+            parent_path = get_ind_path(ind.structure.parent_label, os.path.join(root_dir, "results", experiment_name))
+            if parent_path is not None and os.path.exists(os.path.join(parent_path, 'controller.pt')):
+                parent_controller = os.path.join(parent_path, 'controller.pt')
+
+        config = ppo_config
+        if ppo_overrides is not None:
+            config = config.replace(**ppo_overrides(ind))
+
+        ## REUSE PREVIOUS EVALUATION OF THE SAME DESIGN
+        callback = ind.set_result
+        if eval_store is not None:
+            args = {**config.asdict(), 'env_name': env_name, 'num_episode': num_episode}
+            if parent_controller is not None:
+                args['warm_start'] = file_hash(parent_controller)
+            key = eval_store.key(ind.structure.body, ind.structure.connections, env_name, args, config.seed)
+            entry = eval_store.get(key)
+            if entry is not None:
+                print(f'Individual {ind.structure.label} already evaluated: reusing {entry["controller"]}')
+                controller_path = os.path.join(save_path, 'controller.pt')
+                # a pending individual of a resumed run was stored at its own path
+                if not (os.path.exists(controller_path) and os.path.samefile(entry['controller'], controller_path)):
+                    shutil.copyfile(entry['controller'], controller_path)
+                ind.set_result(mp.JobResult(entry['fitness'], info={'cached_from': entry['controller']}))
+                continue
+            callback = StoreResult(eval_store, key, ind, os.path.join(save_path, 'controller.pt'), experiment_name)
+
+        to_train.append((ind, save_path, callback, parent_controller, config))
+
+    ## COMPUTE FITNESS: RUN PPO OR GROUP JOBS
+    #ind.structure.reward = run_ppo(structure=(ind.structure.body, ind.structure.connections), termination_condition=tc, saving_convention=(save_path, ind.structure.label), verbose=False)
+    if halving is not None and len(to_train) > 1:
+        successive_halving(env_name, to_train, num_episode, num_cores, **halving)
+        return inds
+
+    # warm started trainings are not batched
+    for ind, save_path, callback, parent_controller, config in to_train:
+        if parent_controller is not None:
+            group.add_job(run_ppo, (ind, tc, (save_path, ind.structure.label), env_name, False, False, parent_controller, config), callback=callback)
+
+    # robots are batched with the ones trained with the same config
+    by_config = {}
+    for x in to_train:
+        if x[3] is None:
+            by_config.setdefault(x[4], []).append(x)
+
+    for config, trainings in by_config.items():
+        k = max(1, config.robots_per_process)
+        for start in range(0, len(trainings), k):
+            batch = trainings[start:start+k]
+            if len(batch) == 1:
+                ind, save_path, callback, _, _ = batch[0]
+                group.add_job(run_ppo, (ind, tc, (save_path, ind.structure.label), env_name, False, False, None, config), callback=callback)
+            else:
+                inds_batch = [ind for ind, _, _, _, _ in batch]
+                saving_conventions = [(save_path, ind.structure.label) for ind, save_path, _, _, _ in batch]
+                group.add_job(run_ppo_batch, (inds_batch, tc, saving_conventions, env_name, False, config),
+                              callback=SplitResult([callback for _, _, callback, _, _ in batch]))
 
     group.run_jobs(num_cores)
 
@@ -59,35 +136,154 @@ def simulate(env_name, inds, experiment_name, num_episode=5, num_cores=4):
 
 
 
+def halving_budgets(min_iters, max_iters, eta=3):
+    """
+    Returns the training iterations of the successive rungs: min_iters, min_iters * eta, ... up to max_iters.
+    """
+    budgets = []
+    budget = min_iters
+    while budget < max_iters:
+        budgets.append(budget)
+        budget *= eta
+    return budgets + [max_iters]
+
+
+def successive_halving(env_name, to_train, max_iters, num_cores, min_iters, eta=3):
+    """
+    Trains a cohort of individuals with successive halving: all of them are trained for min_iters iterations,
+    then only the best 1/eta of them (by best evaluation reward so far) continue to min_iters * eta iterations,
+    and so on until max_iters. Trainings are continued, not restarted (run_ppo with resumable=True).
+    The others keep the fitness they reached; the iterations each individual received are in
+    ind.structure.eval_info['budget'] (and the number of rungs it took part in, in 'rung').
+    Rewards are only known at the evaluations of run_ppo: budgets should be multiples of --eval-interval.
+    Budgets are capped at the last update of each training (num_env_steps): an individual whose training
+    is over keeps the result of its last rung.
+    to_train: list of (ind, save_path, callback, parent controller or None, PPOConfig), callback being called with the result of the full trainings
+    """
+    remove_train_states(to_train)     # a stale state (e.g. of an interrupted run) would be resumed at rung 0
+    cohort = to_train
+    budgets = halving_budgets(min_iters, max_iters, eta)
+    results = {}
+    for rung, budget in enumerate(budgets):
+        final = rung == len(budgets) - 1
+        previous, results = results, {}
+        group = mp.Group()
+        for ind, save_path, callback, parent_controller, config in cohort:
+            last_update = config.num_updates - 1
+            if rung > 0 and budgets[rung-1] >= last_update:     # training over at the previous rung
+                result = previous[ind.structure.label]
+                HalvingResult(results, ind.structure.label, result.info['budget'], result.info['rung'], callback if final else None)(result)
+                continue
+            ppo_args = (ind, TerminationCondition(min(budget, last_update)), (save_path, ind.structure.label), env_name, False, True, parent_controller, config)
+            group.add_job(run_ppo, ppo_args, callback=HalvingResult(results, ind.structure.label, min(budget, last_update), rung+1, callback if final else None))
+        group.run_jobs(num_cores)
+        if final:
+            break
+
+        # continue with the best ones, the others are done
+        ranked = sorted(cohort, key=lambda x: results[x[0].structure.label].value if results[x[0].structure.label].ok else float('-inf'), reverse=True)
+        cohort = ranked[:max(1, len(ranked) // eta)]
+        for ind, _, _, _, _ in ranked[len(cohort):]:
+            ind.set_result(results[ind.structure.label])
+        print(f'Successive halving: {len(cohort)} of {len(ranked)} individuals continue to {budgets[rung+1]} iterations')
+
+    remove_train_states(to_train)
+
+
+def remove_train_states(to_train):
+    """
+    Removes the training states saved by the resumable trainings of successive_halving in the save paths of to_train.
+    """
+    for _, save_path, _, _, _ in to_train:
+        try:
+            os.remove(os.path.join(save_path, 'train_state.pt'))
+        except OSError:
+            pass
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class HalvingResult():
+    """
+    Job callback of successive_halving: records the result of a rung, with the budget received,
+    and passes it to callback at the last rung.
+    """
+
+    def __init__(self, results, label, budget, rung, callback=None):
+        self.results = results
+        self.label = label
+        self.budget = budget
+        self.rung = rung
+        self.callback = callback
+
+    def __call__(self, result):
+        result.info.update(budget=self.budget, rung=self.rung)
+        self.results[self.label] = result
+        if self.callback is not None:
+            self.callback(result)
+
+
+class StoreResult():
+    """
+    Job callback: sets the result of the individual and adds successful trainings to the evaluation store.
+    """
+
+    def __init__(self, eval_store, key, ind, controller_path, experiment_name):
+        self.eval_store = eval_store
+        self.key = key
+        self.ind = ind
+        self.controller_path = controller_path
+        self.experiment_name = experiment_name
+
+    def __call__(self, result):
+        self.ind.set_result(result)
+        if result.ok and os.path.exists(self.controller_path):
+            self.eval_store.put(self.key, result.value, self.controller_path,
+                                experiment=self.experiment_name, label=self.ind.structure.label)
+
+
+class SplitResult():
+    """
+    Job callback of run_ppo_batch: calls the callback of each individual with its own JobResult
+    (the batch elapsed time and memory are shared by all of them).
+    """
+
+    def __init__(self, callbacks):
+        self.callbacks = callbacks
+
+    def __call__(self, result):
+        robots_info = result.info.get('robots', [{}] * len(self.callbacks))
+        for k, callback in enumerate(self.callbacks):
+            callback(mp.JobResult(result.value[k] if result.ok else 0.0, result.ok, result.error,
+                                  info=robots_info[k], elapsed=result.elapsed, max_rss=result.max_rss))
+
+
 def evaluate_ind(env_name, individuals, from_exp_name, from_labels, num_cores=4):
     group = mp.Group()
+    vec_env = get_config().vec_env
+
+    # set log dir
+    log_dir = '/tmp/gym/'
+    eval_log_dir = log_dir + "_eval"
+    utils.cleanup_log_dir(log_dir)
+    utils.cleanup_log_dir(eval_log_dir)
 
     for i in range(len(individuals)):
         print('\nEvaluating individual', individuals[i].structure.label, '\n', individuals[i].structure.body, '\n')
 
         # find controller path
-        for (root,dirs,files) in  os.walk(os.path.join('results', from_exp_name), topdown=True):
-            if 'ind' + str(from_labels[individuals[i].structure.label-1]) in dirs:
-                path_controller = os.path.join(root, 'ind' + str(from_labels[individuals[i].structure.label-1]), 'controller.pt')
-        
-        # load controller
-        try:
-            import torch
-            save_path_controller = path_controller
-            actor_critic, obs_rms = torch.load(save_path_controller, map_location='cpu')
-        except:
+        ind_path = get_ind_path(from_labels[individuals[i].structure.label-1], os.path.join('results', from_exp_name))
+        save_path_controller = os.path.join(ind_path, 'controller.pt') if ind_path is not None else None
+        if save_path_controller is None or not os.path.exists(save_path_controller):
             print(f'\nCould not load robot controller data at {save_path_controller}.\n')
             return
 
-        # set log dir
-        log_dir = '/tmp/gym/'
-        eval_log_dir = log_dir + "_eval"
-        utils.cleanup_log_dir(log_dir)
-        utils.cleanup_log_dir(eval_log_dir)
-
-        # set evaluation functions to run
-        args = (1, actor_critic, obs_rms, env_name, (individuals[i].structure.body, individuals[i].structure.connections), 1, 4, eval_log_dir, 'cpu', True)   # same parameters parsed to ppo on all exp
-        group.add_job(evaluate, args, callback=individuals[i].set_fitness)
+        # set evaluation functions to run: the controller is loaded by the worker, from its path
+        args = (save_path_controller, 1, env_name, (individuals[i].structure.body, individuals[i].structure.connections), 1, 4, eval_log_dir, 'cpu', True, None, vec_env)   # same parameters parsed to ppo on all exp
+        group.add_job(evaluate_saved, args, callback=individuals[i].set_result)
 
     # run evaluations
     group.run_jobs(num_cores)
@@ -105,26 +301,17 @@ def make_env(env_name, seed=-1, ind=None):
 
 
 def compute_features(ind, features_list):
-    length = compute_length(ind.structure)
-    height = compute_height(ind.structure)
-    baseLength = compute_base_length(ind.structure)
-    emptiness = compute_emptiness(ind.structure)
-    compactness = compute_compactness(ind.structure)
-    elongation = compute_elongation(ind.structure, 2)
-    actuation, v_actuation, h_actuation = compute_actuation(ind.structure)
-    scores = {
-            "reward": ind.structure.fitness,
-            "length": length,     
-            "height": height,
-            "baseLength": baseLength,
-            "emptiness": emptiness,
-            "compactness": compactness,
-            "elongation": elongation,
-            "actuation": actuation,
-            "verticalActuation": v_actuation,
-            "horizontalActuation": h_actuation
-    } 
-    ind.features.values = [scores[x]*10*0.1 for x in features_list]
+    compute_batch_features([ind], features_list)
+
+
+descriptor_cache = DescriptorCache()     # shared by all the evaluations of the process
+
+def compute_batch_features(inds, features_list):
+    names = [x for x in features_list if x != "reward"]
+    descriptors = descriptor_cache.get([ind.structure.body for ind in inds], names)
+    for ind, scores in zip(inds, descriptors):
+        scores["reward"] = ind.structure.fitness
+        ind.features.values = [scores[x]*10*0.1 for x in features_list]
 
 
 ### GET ENVIRONMENT ###
@@ -57,6 +57,21 @@ label = 0
 best_after_eval = {}
 activity_after_eval = {}
 
+def get_run_state() -> Mapping[str, Any]:
+    """Return the run counters shared by all algorithms (labels, generation, trends), to be saved in checkpoints."""
+    return {"label": label, "generation": generation,
+            "best_after_eval": dict(best_after_eval), "activity_after_eval": dict(activity_after_eval)}
+
+def set_run_state(state: Mapping[str, Any]) -> None:
+    """Restore the run counters saved with `get_run_state`."""
+    global label, generation
+    label = state["label"]
+    generation = state["generation"]
+    best_after_eval.clear()
+    best_after_eval.update(state["best_after_eval"])
+    activity_after_eval.clear()
+    activity_after_eval.update(state["activity_after_eval"])
+
 def _evalWrapper(eval_id: int, fn: Callable, *args, **kwargs) -> Tuple[int, float, Any, Any]:
     """Wrapper around an evaluation function. It catches any exceptions raised by the evaluation function (as exceptions might be lost depending on which kind of parallelism scheme is applied to launch evaluations). It also measures the time elapsed by the evaluation function computation."""
     start_time = timer()
@@ -284,6 +299,18 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
         self._nb_updated_in_iteration = 0
 
 
+    def get_checkpoint_state(self) -> Mapping[str, Any]:
+        """Return the state of the optimisation (budget and counters) needed to resume it. The container is not included."""
+        return {k: getattr(self, k) for k in ["budget", "_nb_suggestions", "_nb_suggestions_in_iteration", "_nb_evaluations",
+            "_nb_evaluations_in_iteration", "_nb_updated", "_nb_updated_in_iteration"]}
+
+    def set_checkpoint_state(self, state: Mapping[str, Any], container: Container) -> None:
+        """Restore a state returned by `get_checkpoint_state`, and use `container` as container."""
+        for k, v in state.items():
+            setattr(self, k, v)
+        self.container = container
+
+
     def __getstate__(self):
         odict = self.__dict__.copy()
         del odict['_base_ind_gen']
@@ -437,7 +464,9 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
             If provided, set `individual.elapsed` to `elapsed`.
             It corresponds to the time (in seconds) elapsed during evaluation.
         """
-        ind = copy.deepcopy(individual)
+        if getattr(individual, 'structure', None) is not None:
+            individual.structure.freeze()       # evaluated: shared with the copy instead of being copied
+        ind = individual.clone() if isinstance(individual, Individual) else copy.deepcopy(individual)
         if fitness is not None:
             if isinstance(fitness, FitnessLike):
                 ind.fitness = fitness
@@ -548,7 +577,9 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
 
 
     def optimise(self, evaluate: Callable, budget: Optional[int] = None, batch_mode: bool = True,
-            executor: Optional[ExecutorLike] = None, pop_structure_hashes: dict = None, structures = None) -> tuple:
+            executor: Optional[ExecutorLike] = None, pop_structure_hashes: dict = None, structures = None,
+            async_mode: bool = False, max_in_flight: Optional[int] = None,
+            checkpoint_fn: Optional[Callable] = None, resume: bool = False, pending: Sequence[IndividualLike] = ()) -> tuple:
         """
         Optimization process.
 
@@ -559,6 +590,14 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
             executor (ExecutorLike): type of executor
             pop_structure_hashes (dict): keep track of already evaluated structures to avoid duplicates
             structure (list): if provided, structures of individuals to evaluate
+            async_mode (bool): if True, evaluate individuals one by one on the executor, asking a new one as soon as
+                an evaluation finishes and telling results in completion order (steady-state). `batch_mode` is ignored.
+                `evaluate` is called from the executor, so a thread-based executor ('multithreading') is expected
+            max_in_flight (int): max number of evaluations running at the same time in async mode (default: batch_size)
+            checkpoint_fn (callable function): if provided, called with the list of individuals being evaluated
+                (asked, but not told yet) each time new evaluations are launched, to save a checkpoint
+            resume (bool): if True, continue an optimisation restored from a checkpoint, instead of starting a new generation
+            pending (list): individuals that were being evaluated when the checkpoint was saved, evaluated first when resuming
 
         Returns:
             best_after_eval (dict): key=evaluations, value=best fitness after evaluations
@@ -567,9 +606,11 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
 
         global label
         global generation
-        generation += 1
+        if not resume:
+            generation += 1
+            self._nb_evaluations = 0
         print("\n*** Optimizing... generation_" + str(generation))
-        self._nb_evaluations = 0
+        to_resume = list(pending)
 
         optimisation_start_time: float = timer()
         # Init budget
@@ -582,8 +623,33 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
         for fn in self._callbacks.get("started_optimisation"):
             fn(self)    
 
-        def optimisation_loop(budget_fn: Callable):
+        def new_individual() -> IndividualLike:
+            """Ask for an individual whose structure was not evaluated yet, and set its label and generation."""
             global label
+            while True:
+                ind: IndividualLike = self.ask()
+                if ind.structure != None:
+                    if pop_structure_hashes == None or structures!=None:    # no track of structures
+                        break
+                    elif hashable(ind.structure.body) not in pop_structure_hashes: # structure not evaluated yet
+                        pop_structure_hashes[hashable(ind.structure.body)] = True
+                        break
+            label += 1
+            ind.structure.label = label
+            ind.structure.generation = generation
+
+            # copy structure from existing experiment
+            if structures != None:
+                ind.structure.body = structures[label-1][0]
+                ind.structure.connections = structures[label-1][1]
+            return ind
+
+        def update_trends(nb_evaluated: int):
+            if len(self.container) > 0:     # may still be empty if all the evaluations failed
+                best_after_eval[nb_evaluated] = self.best().fitness[0]
+                activity_after_eval[nb_evaluated] = len( np.matrix.nonzero(self.container.activity_per_bin) [0] )
+
+        def optimisation_loop(budget_fn: Callable):
             budget = budget_fn()
             remaining_evals = budget
             batch_start_time: float = timer()
@@ -600,26 +666,13 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
                 nb_suggestions = min(remaining_evals, self.batch_size, self.budget - self.nb_evaluations)
 
                 # Launch evals on suggestions
-                individuals = []
-                while len(individuals) < nb_suggestions:
-                    ind: IndividualLike = self.ask()
-                    if ind.structure != None:
-                        if pop_structure_hashes == None or structures!=None:    # no track of structures
-                            individuals.append(ind)
-                        elif hashable(ind.structure.body) not in pop_structure_hashes: # structure not evaluated yet
-                            individuals.append(ind)
-                            pop_structure_hashes[hashable(ind.structure.body)] = True
-
-                for ind in individuals:    # set label, generation
-                    label += 1
-                    ind.structure.label = label
-                    ind.structure.generation = generation
-                    
-                    # copy structure from existing experiment
-                    if structures != None:
-                        ind.structure.body = structures[label-1][0]
-                        ind.structure.connections = structures[label-1][1]
-
+                if len(to_resume) > 0:
+                    individuals = list(to_resume)
+                    to_resume.clear()
+                else:
+                    individuals = [new_individual() for _ in range(nb_suggestions)]
+                if checkpoint_fn is not None:
+                    checkpoint_fn(individuals)
                 individuals = evaluate(individuals)
 
                 for ind in individuals:
@@ -631,10 +684,49 @@ class QDAlgorithm(abc.ABC, QDAlgorithmLike, Summarisable, Saveable, Copyable, Cr
                 if self._verify_if_finished_iteration(batch_start_time):
                     batch_start_time = timer()
 
-                best_after_eval[label] = self.best().fitness[0]
-                activity_after_eval[label] = len( np.matrix.nonzero(self.container.activity_per_bin) [0] )
+                update_trends(label)
 
-        if batch_mode:
+        def async_optimisation_loop():
+            nb_in_flight = max_in_flight if max_in_flight is not None else int(min(self.batch_size, self.budget))
+            nb_in_flight = max(1, nb_in_flight)
+            nb_launched = self.nb_evaluations
+            pending: Dict[Any, IndividualLike] = {}
+            batch_start_time: float = timer()
+
+            while nb_launched < self.budget or len(pending) > 0 or len(to_resume) > 0:
+                # Keep all the evaluation slots busy
+                launched = False
+                while (nb_launched < self.budget or len(to_resume) > 0) and len(pending) < nb_in_flight:
+                    ind = to_resume.pop(0) if len(to_resume) > 0 else new_individual()
+                    pending[_executor.submit(_evalWrapper, ind.structure.label, evaluate, [ind])] = ind
+                    nb_launched += 1
+                    launched = True
+                if launched and checkpoint_fn is not None:
+                    checkpoint_fn(list(pending.values()) + to_resume)
+
+                # Tell results in completion order
+                future = generic_as_completed(list(pending.keys()))
+                ind = pending.pop(future)
+                _, elapsed, res, exc = future.result()
+                if exc is not None:
+                    # told as a failed evaluation (invalid fitness), like the failed jobs of a batch
+                    warnings.warn(f"Evaluation of individual {ind.structure.label} failed: {exc}")
+                    ind.structure.eval_info = {'ok': False, 'error': str(exc)}
+                    ind.elapsed = elapsed
+                    self.tell(ind, fitness=[math.nan] * self._nb_objectives)
+                else:
+                    for evaluated in res:
+                        self.tell(evaluated)
+
+                if self._verify_if_finished_iteration(batch_start_time):
+                    batch_start_time = timer()
+
+                update_trends(self.nb_evaluations)     # results are told in completion order, not in label order
+
+        if async_mode:
+            async_optimisation_loop()
+
+        elif batch_mode:
             budget = self.budget
             remaining_evals: int = budget
             while remaining_evals > 0:
@@ -912,16 +1004,29 @@ class Sq(QDAlgorithmLike, Summarisable, Saveable, Copyable, CreatableFromConfig)
 
     def optimise(self, evaluate: Callable, budget: Optional[int] = None, 
             batch_mode: bool = True, executor: Optional[ExecutorLike] = None,
-            pop_structure_hashes: dict = None, structures: str = '') -> tuple:
+            pop_structure_hashes: dict = None, structures: str = '',
+            async_mode: bool = False, max_in_flight: Optional[int] = None,
+            checkpoint_fn: Optional[Callable] = None, resume: bool = False, pending: Sequence[IndividualLike] = ()) -> tuple:
         for _ in range(self.current_idx, len(self.algorithms)):
             try:
-                res = self.current.optimise(evaluate, budget, batch_mode, executor, pop_structure_hashes=pop_structure_hashes, structures=structures)
+                res = self.current.optimise(evaluate, budget, batch_mode, executor, pop_structure_hashes=pop_structure_hashes, structures=structures,
+                        async_mode=async_mode, max_in_flight=max_in_flight, checkpoint_fn=checkpoint_fn, resume=resume, pending=pending)
             except Exception as e:
                 warnings.warn(f"Optimisation failed with algorithm '{self.current.name}': {e}")
                 traceback.print_exc()
+            resume, pending = False, ()     # only the current algorithm is resumed
             self.next()
         return res
 
+    def get_checkpoint_state(self) -> Mapping[str, Any]:
+        return {"current_idx": self.current_idx, "algorithms": [a.get_checkpoint_state() for a in self.algorithms]}
+
+    def set_checkpoint_state(self, state: Mapping[str, Any], container: Container) -> None:
+        for a, a_state in zip(self.algorithms, state["algorithms"]):
+            a.set_checkpoint_state(a_state, container)
+        self.current_idx = state["current_idx"]
+        self.current = self.algorithms[self.current_idx]
+
     def add_callback(self, event: str, fn: Callable) -> None:
         for a in self.algorithms:
             a.add_callback(event, fn)
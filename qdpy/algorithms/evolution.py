@@ -37,8 +37,8 @@ from qdpy.base import *
 from qdpy.containers import *
 from qdpy import tools
 
-from utils.algo_utils import Structure, mutate
-from evogym import sample_robot
+from utils.algo_utils import Structure, mutate_valid
+from evogym import sample_robot, get_full_connectivity
 
 ## no mutation applied in Evolution class (will mutate in qd/sim.py)
 
@@ -88,7 +88,7 @@ class Evolution(QDAlgorithm):
         if self._select_fn is not None:
             selected: IndividualLike = self._select_fn(self.container)
             if self.deepcopy_on_selection:
-                selected = copy.deepcopy(selected)
+                selected = selected.clone() if isinstance(selected, Individual) else copy.deepcopy(selected)
             if not isinstance(selected, IndividualLike):
                 if isinstance(selected, Sequence) and isinstance(selected[0], IndividualLike):
                     selected = selected[0]
@@ -101,7 +101,7 @@ class Evolution(QDAlgorithm):
             elif self._select_or_initialise_fn_nb_parameters >= 2:
                 selected, perform_variation = self._select_or_initialise_fn(self.container, base_ind)
             if self.deepcopy_on_selection:
-                selected = copy.deepcopy(selected)
+                selected = selected.clone() if isinstance(selected, Individual) else copy.deepcopy(selected)
             if perform_variation and not isinstance(selected, IndividualLike):
                 raise RuntimeError("`select_or_initialise` function returned an unknown type of individual.")
         else:
@@ -136,23 +136,34 @@ class Evolution(QDAlgorithm):
 
 @registry.register
 class Mutation(Evolution):
-    """ apply mutation defined in algo_utils.py """
+    """ apply mutation defined in algo_utils.py
+    The parents of a batch (``batch_size`` individuals selected at random in the container) are mutated at once,
+    and their children are suggested one by one. """
+    _children: List[Tuple[np.ndarray, int]]     # (body, parent label) of the children not suggested yet
 
     def __init__(self, container: Container, budget: int, **kwargs):
         select = tools.sel_random
         def vary(ind: IndividualLike): #perform mutation
             ind[:] = [random.uniform(0, 1)]  # needed to correctly save individuals in the container
-            body, conn = mutate(ind.structure.body, ind.structure.shape, num_attempts=50)
-            structure = Structure(body, conn, shape = ind.structure.shape)
-            ind.structure = structure
-
-            if body is None or conn is None:    # mutation failed after num_attempts
-                structure = None
-
+            body = mutate_valid(np.asarray(ind.structure.body)[None], num_attempts=50)[0]
+            structure = Structure(body, get_full_connectivity(body), shape = ind.structure.shape)
+            structure.parent_label = ind.structure.label
             ind.structure = structure
             return ind
 
         super().__init__(container, budget, select=select, vary=vary, **kwargs)
+        self._children = []
+
+    def _internal_ask(self, base_ind: IndividualLike) -> IndividualLike:
+        if len(self._children) == 0:
+            parents = [self._select_fn(self.container) for _ in range(int(min(self.batch_size, self.budget)))]
+            bodies = mutate_valid(np.stack([np.asarray(p.structure.body) for p in parents]), num_attempts=50)
+            self._children = [(body, p.structure.label) for body, p in zip(bodies, parents)][::-1]
+        body, parent_label = self._children.pop()
+        base_ind[:] = [random.uniform(0, 1)]  # needed to correctly save individuals in the container
+        base_ind.structure = Structure(body, get_full_connectivity(body), shape = np.asarray(body).shape)
+        base_ind.structure.parent_label = parent_label
+        return base_ind
 
 
 @registry.register
@@ -204,6 +204,11 @@ class AlgorithmLogger(Saveable):
             for i in range(len(best_fitness), self._max_nb_objectives - len(best_fitness)):
                 self._evals_data.setdefault(f'max{i}', []).append(np.nan)
         self._evals_data.setdefault('elapsed', []).append(ind.elapsed)
+        eval_info = getattr(getattr(ind, 'structure', None), 'eval_info', {})
+        self._evals_data.setdefault('eval_ok', []).append(eval_info.get('ok', True))
+        self._evals_data.setdefault('max_rss', []).append(eval_info.get('max_rss', np.nan))
+        self._evals_data.setdefault('train_updates', []).append(eval_info.get('updates', np.nan))
+        self._evals_data.setdefault('train_budget', []).append(eval_info.get('budget', np.nan))
         self._lock_evals_data.release()
         self._current_evaluation += 1
 
@@ -21,6 +21,7 @@ __all__ = ["SampleAveragingStrategy", "ExplicitSampleAveragingStrategy", "Sample
 from typing import Optional, Tuple, List, Iterable, Iterator, Any, TypeVar, Generic, Union, Sequence, MutableSet, MutableSequence, Type, Callable, Generator, Mapping, MutableMapping, overload
 import numpy as np
 import random
+import copy
 
 from .base import *
 from qdpy.base import *
@@ -176,6 +177,9 @@ class SampledIndividual(Individual):
         super().reset()
         #self.expected_max_samples = 1
 
+    def clone(self) -> "SampledIndividual":
+        return copy.deepcopy(self)     # the samples of fitness and features must be copied too
+
     def merge(self, other):
         self.fitness.merge(other.fitness)
         self.features.merge(other.features)
@@ -16,7 +16,7 @@
 """TODO"""
 #from __future__ import annotations
 
-__all__ = ["OrderedSet", "Container", "Grid", "CVTGrid", "NoveltyArchive"]
+__all__ = ["OrderedSet", "identity_key", "ItemsIndex", "Container", "grid_indexes", "grid_elites", "GridBinsView", "Grid", "CVTGrid", "NoveltyArchive"]
 
 ########### IMPORTS ########### {{{1
 import sys
@@ -27,15 +27,20 @@ import math
 from functools import reduce
 import operator
 import numpy as np
-from typing import Optional, Tuple, List, Iterable, Iterator, Any, TypeVar, Generic, Union, Sequence, MutableSet, MutableSequence, Type, Callable, Generator, MutableMapping, Mapping, overload
+from typing import Optional, Tuple, List, Dict, Iterable, Iterator, Any, TypeVar, Generic, Union, Sequence, MutableSet, MutableSequence, Type, Callable, Generator, MutableMapping, Mapping, Hashable, overload
 from typing_extensions import runtime, Protocol
 import traceback
 import random
+import bisect
+import os
+import json
+import hashlib
+import tempfile
 
 from qdpy.utils import *
 from qdpy.phenotype import *
 from qdpy.base import *
-from qdpy.metrics import novelty, novelty_local_competition, novelty_nn
+from qdpy.metrics import novelty, novelty_local_competition, novelty_nn, FeaturesIndex
 
 
 
@@ -122,6 +127,50 @@ class OrderedSet(MutableSet[T], Sequence[T]):
 
 BackendLike = Union[MutableSequence[T], OrderedSet[T]]
 
+
+def identity_key(individual: Any) -> Hashable:
+    """Return the key identifying ``individual`` in an ``ItemsIndex``: the result of its ``identity_key`` method if it has one, or else the individual itself (compared with ``__eq__``)."""
+    key_fn = getattr(individual, "identity_key", None)
+    return key_fn() if key_fn is not None else individual
+
+
+class ItemsIndex(object):
+    """Hash index of the items of a backend collection of a container, giving the membership and the position of an item from its identity key without comparing it to the other items.
+    The position of an item is its insertion ordinal minus the number of items removed before it."""
+
+    _ordinals: Dict[Hashable, int]  # Insertion ordinal of each key
+    _keys: List[Hashable]           # Keys, in the order of the collection
+    _removed: List[int]             # Sorted insertion ordinals of the removed items
+    _nb_appended: int
+
+    def __init__(self) -> None:
+        self._ordinals = {}
+        self._keys = []
+        self._removed = []
+        self._nb_appended = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._ordinals
+
+    def index(self, key: Hashable) -> int:
+        """Return the position of ``key`` in the collection, raising a KeyError if it is absent."""
+        ordinal = self._ordinals[key]
+        return ordinal - bisect.bisect_left(self._removed, ordinal)
+
+    def append(self, key: Hashable) -> None:
+        """Register ``key`` as the last item of the collection."""
+        self._ordinals[key] = self._nb_appended
+        self._keys.append(key)
+        self._nb_appended += 1
+
+    def delete(self, index: int) -> None:
+        """Unregister the item at position ``index`` of the collection."""
+        key = self._keys.pop(index)
+        bisect.insort(self._removed, self._ordinals.pop(key))
+
 ########### CONTAINER CLASSES ########### {{{1
 
 # TODO verify that containers are thread-safe
@@ -141,6 +190,8 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
         TODO
     features_domain: Sequence[DomainLike] (sequence of 2-tuple of numbers)
         TODO
+    check_index: bool
+        If True, cross-check every lookup in the hash indexes of the items and depot against a linear search in the collection (slow, for debugging).
     """ # TODO
 
     name: Optional[str]
@@ -157,12 +208,16 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
     _nb_discarded: int
     _nb_added: int
     _nb_rejected: int
+    _items_index: ItemsIndex
+    _depot_index: Optional[ItemsIndex]
+    check_index: bool
 
     def __init__(self, iterable: Optional[Iterable] = None,
             storage_type: Type[BackendLike] = list, depot_type: Union[bool, Type[BackendLike]] = False,
             fitness_domain: Optional[Sequence[DomainLike]] = None,
             features_domain: Optional[Sequence[DomainLike]] = None,
             capacity: Optional[float] = None, name: Optional[str] = None,
+            check_index: bool = False,
             **kwargs: Any) -> None:
         self.items = storage_type()
         if depot_type is True:
@@ -171,6 +226,9 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
             self.depot = depot_type()
         else:
             self.depot = None
+        self._items_index = ItemsIndex()
+        self._depot_index = ItemsIndex() if self.depot is not None else None
+        self.check_index = check_index
         self.fitness_domain = fitness_domain
         if self.fitness_domain is not None:
             for f in self.fitness_domain:
@@ -194,6 +252,23 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
         if iterable is not None:
             self.update(iterable)
 
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        if "_items_index" not in state: # Pickled before the containers had hash indexes
+            self._rebuild_indexes()
+
+    def _rebuild_indexes(self) -> None:
+        """Rebuild the hash indexes of the items and of the depot from their content."""
+        self._items_index = ItemsIndex()
+        for individual in self.items:
+            self._items_index.append(identity_key(individual))
+        self._depot_index = None
+        if self.depot is not None:
+            self._depot_index = ItemsIndex()
+            for individual in self.depot:
+                self._depot_index.append(identity_key(individual))
+        self.check_index = getattr(self, "check_index", False)
+
     @property
     def capacity(self) -> float:
         """Return the capacity of the container (i.e. maximal number of items/spots/bins/etc). Can be math.inf."""
@@ -302,11 +377,18 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
         return self.items[key]
 
     def __contains__(self, key: Any) -> bool:
-        return key in self.items
+        return self._index_in_collection(self.items, self._items_index, key) is not None
 
     def __iter__(self) -> Iterator[IndividualLike]:
         return iter(self.items)
 
+    def index(self, individual: Any, start: int = 0, stop: Optional[int] = None) -> int:
+        """Return the index of ``individual`` in the container, raising a ValueError if it is absent."""
+        idx = self._index_in_collection(self.items, self._items_index, individual)
+        if idx is None or idx < start or (stop is not None and idx >= stop):
+            raise ValueError(f"{individual!r} is not in container")
+        return idx
+
 #    def __reversed__(self) -> Iterator[IndividualLike]:
 #        return reversed(self.items)
 
@@ -316,28 +398,40 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
         return "%s(%r)" % (self.__class__.__name__, list(self))
 
 
-    def _add_to_collection(self, collection: BackendLike[IndividualLike], individual: IndividualLike) -> Tuple[bool,int]:
-        """Add ``individual`` to ``collection``.
+    def _index_in_collection(self, collection: BackendLike[IndividualLike], items_index: ItemsIndex, individual: Any, key: Optional[Hashable] = None) -> Optional[int]:
+        """Return the index of ``individual`` in ``collection``, or None if it is absent, using the hash index ``items_index`` of ``collection``. ``key`` is the identity key of ``individual``, if already known."""
+        try:
+            index: Optional[int] = items_index.index(identity_key(individual) if key is None else key)
+        except KeyError:
+            index = None
+        if self.check_index:
+            try:
+                expected: Optional[int] = collection.index(individual)
+            except ValueError:
+                expected = None
+            if index != expected:
+                warnings.warn(f"Index of {individual!r} in {self.name} is {index}, but a linear search finds {expected}.")
+        return index
+
+    def _add_to_collection(self, collection: BackendLike[IndividualLike], items_index: ItemsIndex, individual: IndividualLike) -> Tuple[bool,int]:
+        """Add ``individual`` to ``collection``, and register it in ``items_index``, the hash index of ``collection``.
         Return a tuple containing (added, index), with ``added`` a bool saying whether ``individual`` was added or not to ``collection``, and ``index`` the index in the ``collection``.
         ``collection`` can be a MutableSequence or an ordered set implementing Sequence and MutableSet."""
-        old_len: int = len(collection)
+        key: Hashable = identity_key(individual)
+        index: Optional[int] = self._index_in_collection(collection, items_index, individual, key)
+        if index is not None:
+            return False, index
         if isinstance(collection, MutableSet):
+            old_len: int = len(collection)
             collection.add(individual)
             if len(collection) == old_len:
                 return False, collection.index(individual)
-            else:
-                return True, len(collection) - 1
         elif isinstance(collection, MutableSequence):
-            added: bool = False
-            try:
-                index: int = collection.index(individual)
-            except ValueError:
-                collection.append(individual)
-                index = len(collection) - 1
-                added = True
-            return added, index
+            collection.append(individual)
         else:
             raise ValueError("collection must be an ordered set implementing MutableSet or a Sequence")
+        items_index.append(key)
+        return True, len(collection) - 1
 
 
     def in_bounds(self, val: Any, domain: Any) -> bool:
@@ -378,7 +472,7 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
             self._nb_rejected += 1
             raise ValueError(f"`only_to_depot` can only be set to True if a depot exists.")
         # Add to depot, if needed
-        added_depot, index_depot = self._add_to_collection(self.depot, individual) if self.depot is not None else False, 0
+        added_depot, index_depot = self._add_to_collection(self.depot, self._depot_index, individual) if self.depot is not None else False, 0
         if raise_if_not_added_to_depot and not added_depot:
             self._nb_rejected += 1
             raise ValueError(f"Individual could not be added to the depot.")
@@ -386,7 +480,7 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
             return None
         else:
             # Add to storage
-            added, index = self._add_to_collection(self.items, individual)
+            added, index = self._add_to_collection(self.items, self._items_index, individual)
             # Update best_fitness
             if added:
                 #if self._best is None or self._dominates(individual, self._best):
@@ -411,19 +505,17 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
         # Remove from depot
         if also_from_depot and self.depot is not None:
             if idx_depot is None:
-                try:
-                    self.depot.remove(individual)
-                except KeyError:
-                    pass
-            else:
+                idx_depot = self._index_in_collection(self.depot, self._depot_index, individual)
+            if idx_depot is not None:
                 del self.depot[idx_depot]
+                self._depot_index.delete(idx_depot)
         # Remove from container
         if idx is None:
-            try:
-                idx = self.items.index(individual)
-            except KeyError:
+            idx = self._index_in_collection(self.items, self._items_index, individual)
+            if idx is None:
                 return
         del self.items[idx]
+        self._items_index.delete(idx)
         del self.recentness[idx]
         self._size -= 1
         self._nb_discarded += 1
@@ -433,19 +525,7 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
 
     def discard(self, individual: IndividualLike, also_from_depot: bool = False) -> None:
         """Remove ``individual`` of the container. If ``also_from_depot`` is True, discard it also from the depot, if it exists."""
-        idx_depot = None
-        idx = None
-        if also_from_depot and self.depot is not None:
-            try:
-                idx_depot = self.depot.index(individual)
-            except KeyError:
-                pass
-        # Remove from container
-        try:
-            idx = self.items.index(individual)
-        except KeyError:
-            pass
-        self._discard_by_index(individual, idx, idx_depot, also_from_depot)
+        self._discard_by_index(individual, None, None, also_from_depot)
 
 
     def update(self, iterable: Iterable, ignore_exceptions: bool = True, issue_warning: bool = False) -> int:
@@ -455,36 +535,42 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
         nb_inserted: int = 0
         item_index: Optional[int] = None
         try:
-            if ignore_exceptions and issue_warning:
-                for item in iterable:
-                    try:
-                        item_index = self.add(item)
-                        if item_index is not None:
-                            nb_inserted += 1
-                    except IndexError as e:
-                        warnings.warn(f"Adding individual failed (index out of bounds): {str(e)}")
-                    except ValueError as e:
-                        warnings.warn(f"Adding individual failed (attribute out of bounds): {str(e)}")
-                    except Exception as e:
-                        warnings.warn(f"Adding individual failed: {str(e)}")
-                        traceback.print_exc()
-            elif ignore_exceptions:
-                for item in iterable:
-                    try:
-                        item_index = self.add(item)
-                        if item_index is not None:
-                            nb_inserted += 1
-                    except Exception:
-                        pass
-            else:
-                for item in iterable:
-                    item_index = self.add(item)
-                    if item_index is not None:
-                        nb_inserted += 1
+            items: List[IndividualLike] = list(iterable)
         except TypeError:
             raise ValueError(f"Argument needs to be an Iterable, got {type(Iterable)}")
+        add = self._batch_add_fn(items)
+        if ignore_exceptions and issue_warning:
+            for item in items:
+                try:
+                    item_index = add(item)
+                    if item_index is not None:
+                        nb_inserted += 1
+                except IndexError as e:
+                    warnings.warn(f"Adding individual failed (index out of bounds): {str(e)}")
+                except ValueError as e:
+                    warnings.warn(f"Adding individual failed (attribute out of bounds): {str(e)}")
+                except Exception as e:
+                    warnings.warn(f"Adding individual failed: {str(e)}")
+                    traceback.print_exc()
+        elif ignore_exceptions:
+            for item in items:
+                try:
+                    item_index = add(item)
+                    if item_index is not None:
+                        nb_inserted += 1
+                except Exception:
+                    pass
+        else:
+            for item in items:
+                item_index = add(item)
+                if item_index is not None:
+                    nb_inserted += 1
         return nb_inserted
 
+    def _batch_add_fn(self, items: Sequence[IndividualLike]) -> Callable[[IndividualLike], Optional[int]]:
+        """Return the function used by ``update`` to add each individual of ``items``. Containers can override it to prepare the insertion of the whole batch at once."""
+        return self.add
+
 
     def clear(self) -> None:
         """Clear all individual in the collection (but not those in the depot, see method ``clear_all``)."""
@@ -497,19 +583,24 @@ class Container(Sequence, Summarisable, Copyable, CreatableFromConfig):
         self.clear()
         if self.depot is not None:
             self.depot.clear()
+            self._rebuild_indexes()
+
 
+    def _depot_features_index(self) -> Optional[FeaturesIndex]:
+        """Return the ``FeaturesIndex`` of the depot, if the container maintains one."""
+        return None
 
     def novelty(self, individual: IndividualLike, **kwargs):
         """Returns the novelty score of `individual`, using the depot as archive. TODO""" # TODO
         if self.depot is None:
             raise RuntimeError(f"A depot is necessary to assess novelty.")
-        return novelty(individual, self.depot, **kwargs)
+        return novelty(individual, self.depot, index=self._depot_features_index(), **kwargs)
 
     def novelty_local_competition(self, individual: IndividualLike, **kwargs):
         """Returns the novelty and local competition scores of `individual`, using the depot as archive. TODO""" # TODO
         if self.depot is None:
             raise RuntimeError(f"A depot is necessary to assess novelty.")
-        return novelty_local_competition(individual, self.depot, **kwargs)
+        return novelty_local_competition(individual, self.depot, index=self._depot_features_index(), **kwargs)
 
 
     def to_grid(self, shape: Union[ShapeLike, int],
@@ -602,17 +693,112 @@ class Population(Container):
 ########### GRID-BASED CLASSES ########### {{{2
 
 # Custom types
-GridSolutionsLike = MutableMapping[GridIndexLike, MutableSequence]
+GridSolutionsLike = Mapping[GridIndexLike, MutableSequence]
 GridItemsPerBinLike = MutableMapping[GridIndexLike, int]
-GridFitnessLike = MutableMapping[GridIndexLike, MutableSequence[FitnessLike]]
-GridFeaturesLike = MutableMapping[GridIndexLike, MutableSequence[FeaturesLike]]
-GridQualityLike = MutableMapping[GridIndexLike, Optional[FitnessLike]]
-GridRecentnessPerBinLike = MutableMapping[GridIndexLike, MutableSequence[int]]
+GridFitnessLike = Mapping[GridIndexLike, MutableSequence[FitnessLike]]
+GridFeaturesLike = Mapping[GridIndexLike, MutableSequence[FeaturesLike]]
+GridQualityLike = Mapping[GridIndexLike, Optional[FitnessLike]]
+GridRecentnessPerBinLike = Mapping[GridIndexLike, MutableSequence[int]]
+
+
+def grid_indexes(features: Any, features_domain: Sequence[DomainLike], shape: ShapeLike) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the indexes of the bins of a grid of shape ``shape`` over ``features_domain`` containing each row of ``features``.
+
+    Parameters
+    ----------
+    :param features: array-like of shape (N, len(shape))
+        Features values of N individuals.
+    :param features_domain: Sequence[DomainLike]
+        Domain of each features dimension.
+    :param shape: ShapeLike
+        Number of bins in each features dimension.
+
+    Return
+    ------
+    indexes: np.ndarray of int, of shape (N, len(shape))
+        Index of the bin of each individual. Rows of invalid features are meaningless.
+    valid: np.ndarray of bool, of shape (N,)
+        False for features outside of the grid (or NaN).
+    """
+    features = np.asarray(features, dtype=float)
+    if features.size == 0:
+        features = features.reshape(0, len(shape))
+    if features.ndim != 2 or features.shape[1] != len(shape):
+        raise IndexError(f"``features`` must be of shape (N, {len(shape)}), got {features.shape}.")
+    domain = np.asarray(features_domain, dtype=float)[:len(shape)]
+    shape_array = np.asarray(shape)
+    span = domain[:, 1] - domain[:, 0]
+    normalised = features - domain[:, 0]
+    with np.errstate(invalid="ignore"):
+        partial = np.trunc(normalised / (span / shape_array))
+        partial = np.where(normalised == span, shape_array - 1, partial)
+        valid = np.all((normalised <= span) & (partial >= 0), axis=1)
+    indexes = np.where(valid[:, None], partial, 0).astype(int)
+    return indexes, valid
+
+
+def grid_elites(features: Any, fitness: Any, features_domain: Sequence[DomainLike], shape: ShapeLike,
+        n: Optional[int] = None, min_fitness: float = -math.inf) -> np.ndarray:
+    """Return the positions of the elites of a batch of individuals binned in a grid, i.e. the individual of highest fitness of each bin of a grid of shape ``shape`` over ``features_domain`` (same binning as ``Grid``), sorted by decreasing fitness.
+
+    Parameters
+    ----------
+    :param features: array-like of shape (N, len(shape))
+        Features values of N individuals.
+    :param fitness: array-like of shape (N,)
+        Fitness value (maximised) of each individual.
+    :param features_domain: Sequence[DomainLike]
+        Domain of each features dimension.
+    :param shape: ShapeLike
+        Number of bins in each features dimension.
+    :param n: Optional[int]
+        Number of elites to return (the best ``n`` ones). If None, return the elites of all bins.
+    :param min_fitness: float
+        Individuals with a fitness lower or equal to ``min_fitness`` (or NaN) are ignored.
+
+    Return
+    ------
+    elites: np.ndarray of int
+        Positions in ``features`` and ``fitness`` of the elites. Ties are won by the first individual.
+    """
+    fitness = np.asarray(fitness, dtype=float)
+    indexes, valid = grid_indexes(features, features_domain, shape)
+    candidates = np.flatnonzero(valid & (fitness > min_fitness))
+    bins = np.ravel_multi_index(tuple(indexes[candidates].T), tuple(shape))
+    # sort by bin, then by decreasing fitness, then by position: the first of each bin is its elite
+    order = np.lexsort((candidates, -fitness[candidates], bins))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = bins[order][1:] != bins[order][:-1]
+    elites = candidates[order[first]]
+    elites = elites[np.argsort(-fitness[elites], kind="stable")]
+    return elites if n is None else elites[:n]
+
+
+class GridBinsView(Mapping):
+    """Read-only mapping from the index of each bin of a ``Grid`` to the list of its elites (or of their fitness, features, recentness...), computed from the arrays of the grid."""
+
+    def __init__(self, grid: "Grid", kind: str) -> None:
+        self.grid = grid
+        self.kind = kind
+
+    def __getitem__(self, ig: GridIndexLike) -> Any:
+        ig = tuple(ig)
+        if len(ig) != len(self.grid.shape) or not all(0 <= i < s for i, s in zip(ig, self.grid.shape)):
+            raise KeyError(ig)
+        return self.grid._bin_content(ig, self.kind)
+
+    def __iter__(self) -> Iterator[GridIndexLike]:
+        return self.grid._index_grid_iterator()
+
+    def __len__(self) -> int:
+        return self.grid._nb_bins
 
 
 @registry.register
 class Grid(Container):
-    """TODO""" # TODO
+    """Container storing the best individuals of each bin of a regular grid over the features domain (at most ``max_items_per_bin`` per bin).
+    The elites of the grid are stored in arrays with one entry per bin and per spot of the bin (``shape + (max_items_per_bin,)``), so that insertions and statistics do not iterate over the bins.
+    ``solutions``, ``fitness``, ``features``, ``quality`` and ``recentness_per_bin`` are read-only views of these arrays."""
 
     fitness_domain: Sequence[DomainLike]
     features_domain: Sequence[DomainLike]
@@ -621,11 +807,16 @@ class Grid(Container):
     _max_items_per_bin: int
     _filled_bins: int
     _solutions: GridSolutionsLike
-    _nb_items_per_bin: GridItemsPerBinLike
+    _nb_items_per_bin: np.array
     _fitness: GridFitnessLike
     _features: GridFeaturesLike
     _quality: GridQualityLike
     _quality_array: np.array
+    _elites_array: np.array
+    _fitness_array: np.array
+    _features_array: np.array
+    _recentness_array: np.array
+    _history_recentness: MutableMapping[GridIndexLike, MutableSequence[int]]
     _bins_size: Sequence[float]
     _nb_bins: int
     recentness_per_bin: GridRecentnessPerBinLike
@@ -658,18 +849,24 @@ class Grid(Container):
 
     def _init_grid(self) -> None:
         """Initialise the grid to correspond to the shape `self.shape`."""
-        self._solutions = {x: [] for x in self._index_grid_iterator()}
-        self._nb_items_per_bin = np.zeros(self._shape, dtype=float) #{x: 0 for x in self._index_grid_iterator()}
-        self._fitness = {x: [] for x in self._index_grid_iterator()}
-        self._features = {x: [] for x in self._index_grid_iterator()}
-        self._quality = {x: None for x in self._index_grid_iterator()}
+        spots_shape = self._shape + (self._max_items_per_bin,)
+        self._elites_array = np.full(spots_shape, None, dtype=object)
+        self._fitness_array = np.full(spots_shape + (len(self.fitness_domain),), np.nan)
+        self._features_array = np.full(spots_shape + (len(self.features_domain),), np.nan)
+        self._recentness_array = np.full(spots_shape, -1, dtype=int)
+        self._history_recentness = {}
+        self._nb_items_per_bin = np.zeros(self._shape, dtype=int)
         self._quality_array = np.full(self._shape + (len(self.fitness_domain),), np.nan)
         self._bins_size = [(self.features_domain[i][1] - self.features_domain[i][0]) / float(self.shape[i]) for i in range(len(self.shape))]
         self._filled_bins = 0
         self._nb_bins = reduce(operator.mul, self._shape)
-        self.recentness_per_bin = {x: [] for x in self._index_grid_iterator()}
-        self.history_recentness_per_bin = {x: [] for x in self._index_grid_iterator()}
         self.activity_per_bin = np.zeros(self._shape, dtype=float)
+        self._solutions = GridBinsView(self, "solutions")
+        self._fitness = GridBinsView(self, "fitness")
+        self._features = GridBinsView(self, "features")
+        self._quality = GridBinsView(self, "quality")
+        self.recentness_per_bin = GridBinsView(self, "recentness")
+        self.history_recentness_per_bin = GridBinsView(self, "history_recentness")
 
 
     @property
@@ -693,7 +890,7 @@ class Grid(Container):
         return self._solutions
 
     @property
-    def nb_items_per_bin(self) -> GridItemsPerBinLike:
+    def nb_items_per_bin(self) -> np.array:
         """Return the number of items stored in each bin of the grid."""
         return self._nb_items_per_bin
 
@@ -717,6 +914,16 @@ class Grid(Container):
         """Return the best fitness values in the grid, as a numpy array."""
         return self._quality_array
 
+    @property
+    def fitness_array(self) -> np.array:
+        """Return the fitness values of all the items of the grid, as a numpy array of shape ``shape + (max_items_per_bin, nb_objectives)`` (NaN for empty spots)."""
+        return self._fitness_array
+
+    @property
+    def features_array(self) -> np.array:
+        """Return the features values of all the items of the grid, as a numpy array of shape ``shape + (max_items_per_bin, nb_features)`` (NaN for empty spots)."""
+        return self._features_array
+
     @property
     def best_index(self) -> Optional[GridIndexLike]:
         """Return the index of the individual with the best quality, or None. """
@@ -733,19 +940,16 @@ class Grid(Container):
 
     def index_grid(self, features: FeaturesLike) -> GridIndexLike:
         """Get the index in the grid of a given individual with features ``features``, raising an IndexError if it is outside the grid. """
-        index: List[int] = []
         if len(features) != len(self.shape):
             raise IndexError(f"Length of parameter ``features`` ({len(features)}) does not corresponds to the number of dimensions of the grid ({len(self.shape)}).")
-        for i in range(len(features)):
-            normalised_feature: float = features[i] - self.features_domain[i][0]
-            if normalised_feature == self.features_domain[i][1] - self.features_domain[i][0]:
-                partial: int = self.shape[i] - 1
-            elif normalised_feature > self.features_domain[i][1] - self.features_domain[i][0]:
-                raise IndexError(f"``features`` ({str(features)}) out of bounds ({str(self.features_domain)})")
-            else:
-                partial = int(normalised_feature / self._bins_size[i])
-            index.append(partial)
-        return tuple(index)
+        indexes, valid = self.index_grid_batch([list(features)])
+        if not valid[0]:
+            raise IndexError(f"``features`` ({str(features)}) out of bounds ({str(self.features_domain)})")
+        return tuple(int(i) for i in indexes[0])
+
+    def index_grid_batch(self, features: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the indexes in the grid of a batch of features (array-like of shape (N, nb_features)). Return the indexes (N, len(shape)) and a boolean array (N,) telling which features are inside the grid. """
+        return grid_indexes(features, self.features_domain, self.shape)
 
 
     def _index_grid_iterator(self) -> Generator[GridIndexLike, None, None]:
@@ -763,23 +967,49 @@ class Grid(Container):
                     yield tuple(val)
                     break
 
+    def _filled_bins_iterator(self) -> Generator[GridIndexLike, None, None]:
+        """Return an iterator of the index of the non-empty bins of the grid."""
+        for ig in np.argwhere(self._nb_items_per_bin > 0):
+            yield tuple(int(i) for i in ig)
+
+    def _best_in_bin(self, ig: GridIndexLike) -> Optional[IndividualLike]:
+        """Return the best individual of bin ``ig``, or None if the bin is empty."""
+        nb_items = self._nb_items_per_bin[ig]
+        if nb_items == 0:
+            return None
+        elites = self._elites_array[ig]
+        best: IndividualLike = elites[0]
+        for i in range(1, nb_items):
+            if elites[i].fitness.dominates(best.fitness):
+                best = elites[i]
+        return best
+
+    def _bin_content(self, ig: GridIndexLike, kind: str) -> Any:
+        """Return the content of bin ``ig`` exposed by the views of the grid."""
+        nb_items = self._nb_items_per_bin[ig]
+        if kind == "solutions":
+            return list(self._elites_array[ig][:nb_items])
+        elif kind == "fitness":
+            return [ind.fitness for ind in self._elites_array[ig][:nb_items]]
+        elif kind == "features":
+            return [ind.features for ind in self._elites_array[ig][:nb_items]]
+        elif kind == "quality":
+            best = self._best_in_bin(ig)
+            return None if best is None else best.fitness
+        elif kind == "recentness":
+            return self._recentness_array[ig][:nb_items].tolist()
+        elif kind == "history_recentness":
+            return self._history_recentness.get(ig, [])
+        else:
+            raise ValueError(f"Unknown kind of bin content: {kind}")
+
     def _update_quality(self, ig: GridIndexLike) -> None:
         """Update quality in bin ``ig`` of the grid."""
-        if self._nb_items_per_bin[ig] == 0:
-            val: Optional[FitnessLike] = None
-        elif self._nb_items_per_bin[ig] == 1:
-            val = self.fitness[ig][0]
-        else:
-            best: IndividualLike = self.solutions[ig][0]
-            for s in self.solutions[ig][1:]:
-                if s.fitness.dominates(best.fitness):
-                    best = s
-            val = best.fitness
-        self.quality[ig] = val
-        if val is None:
+        best = self._best_in_bin(ig)
+        if best is None:
             self.quality_array[ig] = math.nan
         else:
-            self.quality_array[ig] = val.values
+            self.quality_array[ig] = best.fitness.values
 
 
     def add(self, individual: IndividualLike, raise_if_not_added_to_depot: bool = False) -> Optional[int]:
@@ -788,28 +1018,50 @@ class Grid(Container):
         self._check_if_can_be_added(individual)
         # Find corresponding index in the grid
         ig = self.index_grid(individual.features) # Raise exception if features are out of bounds
+        return self._add_to_bin(individual, ig, raise_if_not_added_to_depot)
 
+    def _batch_add_fn(self, items: Sequence[IndividualLike]) -> Callable[[IndividualLike], Optional[int]]:
+        """Index all the individuals of ``items`` at once, then add them one after the other (as they may compete for the same bins)."""
+        indexes: MutableMapping[int, GridIndexLike] = {}
+        try:
+            batch_indexes, valid = self.index_grid_batch([list(ind.features) for ind in items])
+            for ind, ig, v in zip(items, batch_indexes, valid):
+                if v:
+                    indexes[id(ind)] = tuple(int(i) for i in ig)
+        except Exception: # e.g. features of different lengths: index them one by one
+            indexes.clear()
+
+        def add(individual: IndividualLike) -> Optional[int]:
+            self._check_if_can_be_added(individual)
+            ig = indexes.get(id(individual))
+            if ig is None:
+                ig = self.index_grid(individual.features) # Raise exception if features are out of bounds
+            return self._add_to_bin(individual, ig, False)
+        return add
+
+    def _add_to_bin(self, individual: IndividualLike, ig: GridIndexLike, raise_if_not_added_to_depot: bool) -> Optional[int]:
+        """Add ``individual`` to bin ``ig`` of the grid, if there is a spot for it."""
         # Check if individual can be added in grid, if there are enough empty spots
+        nb_items: int = self._nb_items_per_bin[ig]
+        elites = self._elites_array[ig]
         can_be_added: bool = False
-        if self._nb_items_per_bin[ig] < self.max_items_per_bin:
+        if nb_items < self.max_items_per_bin:
             can_be_added = True
         else:
             if self.discard_random_on_bin_overload:
-                idx_to_discard = random.randint(0, len(self.solutions[ig])-1)
-                Container.discard(self, self.solutions[ig][idx_to_discard])
+                idx_to_discard = random.randint(0, nb_items-1)
+                Container.discard(self, elites[idx_to_discard])
                 self._discard_from_grid(ig, idx_to_discard)
                 can_be_added = True
             else:
                 worst_idx = 0
-                worst: IndividualLike = self.solutions[ig][worst_idx]
-                if self._nb_items_per_bin[ig] > 1:
-                    for i in range(1, self._nb_items_per_bin[ig]):
-                        s = self.solutions[ig][i]
-                        if worst.fitness.dominates(s.fitness):
-                            worst = s
-                            worst_idx = i
+                worst: IndividualLike = elites[worst_idx]
+                for i in range(1, nb_items):
+                    if worst.fitness.dominates(elites[i].fitness):
+                        worst = elites[i]
+                        worst_idx = i
                 if individual.fitness.dominates(worst.fitness):
-                    Container.discard(self, self.solutions[ig][worst_idx])
+                    Container.discard(self, elites[worst_idx])
                     self._discard_from_grid(ig, worst_idx)
                     can_be_added = True
 
@@ -821,11 +1073,12 @@ class Grid(Container):
             old_len: int = self._size
             index: Optional[int] = self._add_internal(individual, raise_if_not_added_to_depot, False)
             if index == old_len: # Individual was not already present in container
-                self._solutions[ig].append(individual)
-                self._fitness[ig].append(individual.fitness)
-                self._features[ig].append(individual.features)
-                self.recentness_per_bin[ig].append(self._nb_added)
-                self.history_recentness_per_bin[ig].append(self._nb_added)
+                spot = ig + (int(self._nb_items_per_bin[ig]),)
+                self._elites_array[spot] = individual
+                self._fitness_array[spot] = individual.fitness.values
+                self._features_array[spot] = list(individual.features)
+                self._recentness_array[spot] = self._nb_added
+                self._history_recentness.setdefault(ig, []).append(self._nb_added)
                 self._nb_items_per_bin[ig] += 1
                 self.activity_per_bin[ig] += 1
             # Update quality
@@ -838,12 +1091,13 @@ class Grid(Container):
             return None
 
     def _discard_from_grid(self, ig: GridIndexLike, index_in_bin: int) -> None:
-        # Remove individual from grid
-        del self._solutions[ig][index_in_bin]
+        # Remove individual from grid, shifting the following items of the bin
+        last: int = self._nb_items_per_bin[ig] - 1
+        for array, empty in ((self._elites_array, None), (self._fitness_array, np.nan), (self._features_array, np.nan), (self._recentness_array, -1)):
+            spots = array[ig]
+            spots[index_in_bin:last] = spots[index_in_bin+1:last+1]
+            spots[last] = empty
         self._nb_items_per_bin[ig] -= 1
-        del self._fitness[ig][index_in_bin]
-        del self._features[ig][index_in_bin]
-        del self.recentness_per_bin[ig][index_in_bin]
         # Update quality
         self._update_quality(ig)
         # Update number of filled bins
@@ -864,16 +1118,7 @@ class Grid(Container):
         self._discard_from_grid(ig, index_in_bin)
 
     def _get_best_inds(self):
-        best_inds = []
-        for idx, inds in self.solutions.items():
-            if len(inds) == 0:
-                continue
-            best = inds[0]
-            for ind in inds[1:]:
-                if ind.fitness.dominates(best.fitness):
-                    best = ind
-            best_inds.append(best)
-        return best_inds
+        return [self._best_in_bin(ig) for ig in self._filled_bins_iterator()]
 
 
     def qd_score(self, normalized: bool = True) -> float:
@@ -895,23 +1140,20 @@ class Grid(Container):
         qd_score: float
             QD score of this container.
         """
-        score: float = 0.
         if normalized:
             if self.fitness_domain is None:
                 raise RuntimeError(f"'fitness_domain' must be set to compute normalized QD scores.")
-            else:
-                best_inds = self._get_best_inds()
-                for ind in best_inds:
-                    for v, w, bounds in zip(ind.fitness.values, ind.fitness.weights, self.fitness_domain):
-                        if w < 0.:
-                            score += (bounds[1] - v) / (bounds[1] - bounds[0])
-                        else:
-                            score += (v - bounds[0]) / (bounds[1] - bounds[0])
+            if self._filled_bins == 0:
+                return 0.
+            # The quality array holds the fitness values of the best individual of each bin
+            best_values = self._quality_array[self._nb_items_per_bin > 0]
+            weights = np.asarray(self._best_fitness.weights, dtype=float)
+            bounds = np.asarray(self.fitness_domain, dtype=float)
+            span = bounds[:, 1] - bounds[:, 0]
+            normalized_values = np.where(weights < 0., (bounds[:, 1] - best_values) / span, (best_values - bounds[:, 0]) / span)
+            return float(np.sum(normalized_values))
         else:
-            for ind in self:
-                score += np.sum(ind.fitness.values)
-        return score
-
+            return float(np.nansum(self._fitness_array))
 
 
 
@@ -919,34 +1161,62 @@ class Grid(Container):
 from sklearn.cluster import KMeans
 from sklearn.gaussian_process import GaussianProcessRegressor
 
+DEFAULT_CENTROIDS_CACHE_DIR = os.path.join("~", ".cache", "qdpy", "cvt")
+
 @registry.register
 class CVTGrid(Grid):
-    """TODO""" # TODO
+    """Grid whose bins are the Voronoi cells of ``shape[0]`` cluster centers, computed by k-means on ``nb_sampled_points`` points sampled in the features domain (CVT-MAP-Elites).
+    The cluster centers only depend on ``features_domain``, ``shape``, ``grid_shape``, ``nb_sampled_points`` and ``seed``: they are saved in ``centroids_cache_dir`` (if not None), and loaded from it by the next grids built with the same parameters."""
 
     _grid_shape: ShapeLike
     _nb_sampled_points: int
     cluster_centers: np.array
+    seed: int
+    centroids_cache_dir: Optional[str]
 
     def __init__(self, iterable: Optional[Iterable] = None,
             shape: Union[ShapeLike, int] = (1,), max_items_per_bin: int = 1,
-            grid_shape: Union[ShapeLike, int] = (1,), nb_sampled_points: int = 50000, **kwargs: Any) -> None:
+            grid_shape: Union[ShapeLike, int] = (1,), nb_sampled_points: int = 50000,
+            seed: Optional[int] = None, centroids_cache_dir: Optional[str] = DEFAULT_CENTROIDS_CACHE_DIR, **kwargs: Any) -> None:
         self._grid_shape = tuplify(grid_shape)
         self._nb_sampled_points = nb_sampled_points
-        super().__init__(iterable, shape, max_items_per_bin, **kwargs)
+        self.seed = seed if seed is not None else np.random.randint(2**31)
+        self.centroids_cache_dir = centroids_cache_dir
+        super().__init__(None, shape, max_items_per_bin, **kwargs)
         if len(self.shape) != 1:
             raise ValueError("Using CVTGrid, `shape` must be a scalar or a sequence of length 1.")
         if nb_sampled_points <= 0:
             raise ValueError("`nb_sampled_points` must be positive and greatly superior to `shape` and `grid_shape`.")
         self._init_clusters()
+        if iterable is not None: # Individuals can only be indexed once the clusters are known
+            self.update(iterable)
+
+    def _centroids_cache_path(self) -> Optional[str]:
+        """Return the path of the cache file of the cluster centers, or None if they are not cached."""
+        if not self.centroids_cache_dir:
+            return None
+        key = json.dumps([[list(map(float, d)) for d in self.features_domain], self.shape[0], list(self.grid_shape), self.nb_sampled_points, int(self.seed)])
+        return os.path.join(os.path.expanduser(self.centroids_cache_dir), f"cvt-{hashlib.sha1(key.encode()).hexdigest()}.npy")
 
     def _init_clusters(self) -> None:
-        """Initialise the clusters and tessellate the grid."""
-        sample = np.random.uniform(0.0, 1.0, (self.nb_sampled_points, len(self.grid_shape)))
+        """Initialise the clusters and tessellate the grid, or load them from the cache."""
+        path = self._centroids_cache_path()
+        if path is not None and os.path.exists(path):
+            self.cluster_centers = np.load(path)
+            return
+        rng = np.random.RandomState(self.seed)
+        sample = rng.uniform(0.0, 1.0, (self.nb_sampled_points, len(self.grid_shape)))
         for i, d in enumerate(self.features_domain):
             sample[:, i] = d[0] + (d[1] - d[0]) * sample[:, i]
-        kmeans = KMeans(init="k-means++", n_clusters=self.shape[0], n_init=1, n_jobs=1, verbose=0)
+        kmeans = KMeans(init="k-means++", n_clusters=self.shape[0], n_init=1, verbose=0, random_state=self.seed)
         kmeans.fit(sample)
         self.cluster_centers = kmeans.cluster_centers_
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, self.cluster_centers)
+            os.replace(tmp_path, path)
 
     @property
     def grid_shape(self) -> ShapeLike:
@@ -960,10 +1230,18 @@ class CVTGrid(Grid):
 
     def index_grid(self, features: FeaturesLike) -> GridIndexLike:
         """Get the index in the cvt of a given individual with features ``features``, raising an IndexError if it is outside the cvt. """
-        dists = np.empty(self._shape[0])
-        for i in range(len(dists)):
-            dists[i] = math.sqrt(np.sum(np.square(self.cluster_centers[i] - features)))
-        return (np.argmin(dists),)
+        indexes, _ = self.index_grid_batch([list(features)])
+        return (int(indexes[0, 0]),)
+
+    def index_grid_batch(self, features: Any, chunk_size: int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the indexes in the cvt of a batch of features (array-like of shape (N, nb_features)), i.e. the closest cluster center of each features, by chunks of ``chunk_size`` features."""
+        features = np.asarray(features, dtype=float).reshape(-1, self.cluster_centers.shape[1])
+        indexes = np.empty((len(features), 1), dtype=int)
+        for start in range(0, len(features), chunk_size):
+            chunk = features[start:start+chunk_size]
+            dists = np.sqrt(np.sum(np.square(self.cluster_centers[None, :, :] - chunk[:, None, :]), axis=2))
+            indexes[start:start+chunk_size, 0] = np.argmin(dists, axis=1)
+        return indexes, np.ones(len(features), dtype=bool)
 
 
 
@@ -971,13 +1249,15 @@ class CVTGrid(Grid):
 
 @registry.register
 class NoveltyArchive(Container):
-    """TODO""" # TODO
+    """Container storing the individuals whose novelty (mean distance to their ``k`` nearest neighbours in the depot) is above ``threshold_novelty``, or that outperform their nearest neighbour (which they replace).
+    The features of the individuals of the depot are kept in a ``FeaturesIndex``, updated at each insertion and deletion, to find nearest neighbours with vectorized distances."""
 
     depot: BackendLike[IndividualLike]
 
     k: int
     threshold_novelty: float
     novelty_distance: Union[str, Callable]
+    _depot_features: FeaturesIndex
 
     def __init__(self, iterable: Optional[Iterable] = None,
             k: int = 15, threshold_novelty: float = 0.01, novelty_distance: Union[str, Callable] = "euclidean",
@@ -987,15 +1267,36 @@ class NoveltyArchive(Container):
         self.novelty_distance = novelty_distance
         if depot_type is None:
             raise ValueError("``depot_type`` must be specified for an archive container (either True or a BackendLike class).")
+        self._depot_features = FeaturesIndex()
         super().__init__(iterable, depot_type=depot_type, **kwargs)
 
+    def _rebuild_indexes(self) -> None:
+        super()._rebuild_indexes()
+        self._depot_features = FeaturesIndex([ind.features for ind in self.depot])
+
+    def _depot_features_index(self) -> Optional[FeaturesIndex]:
+        return self._depot_features
+
+    def _add_to_collection(self, collection: BackendLike[IndividualLike], items_index: ItemsIndex, individual: IndividualLike) -> Tuple[bool,int]:
+        added, index = super()._add_to_collection(collection, items_index, individual)
+        if added and collection is self.depot:
+            self._depot_features.append(individual.features)
+        return added, index
+
+    def _discard_by_index(self, individual: IndividualLike, idx: Optional[int] = None, idx_depot: Optional[int] = None, also_from_depot: bool = False) -> None:
+        if also_from_depot and idx_depot is None:
+            idx_depot = self._index_in_collection(self.depot, self._depot_index, individual)
+        super()._discard_by_index(individual, idx, idx_depot, also_from_depot)
+        if also_from_depot and idx_depot is not None:
+            self._depot_features.delete(idx_depot)
+
 
     def add(self, individual: IndividualLike, raise_if_not_added_to_depot: bool = True) -> Optional[int]:
         """Add ``individual`` to the archive, and returns its index, if successful, None elsewise. If ``raise_if_not_added_to_depot`` is True, it will raise and exception if it was not possible to add it also to the depot."""
         # Retrieve features and fitness from individual and check if they are not out-of-bounds
         self._check_if_can_be_added(individual)
         # Find novelty of this individual, and its nearest neighbour
-        novelty, nn = novelty_nn(individual, self.depot, k=self.k, nn_size=1, dist=self.novelty_distance, ignore_first=False)
+        novelty, nn = novelty_nn(individual, self.depot, k=self.k, nn_size=1, dist=self.novelty_distance, ignore_first=False, index=self._depot_features)
         if novelty > self.threshold_novelty:
             # Add individual
             return self._add_internal(individual, raise_if_not_added_to_depot, False)
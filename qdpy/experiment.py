@@ -22,6 +22,8 @@ from qdpy.containers import *
 from qdpy.plots import *
 from qdpy.base import *
 from qdpy import tools
+from qdpy.phenotype import Individual
+import qdpy.algorithms.base as algorithms_base
 from qd.plot import *
 
 import yaml
@@ -30,8 +32,9 @@ import datetime
 import pathlib
 import shutil
 import math
+import pickle
 
-from utils.algo_utils import best_in_exp, get_ind_path, get_stored_structure
+from utils.algo_utils import best_in_exp, get_ind_path, get_stored_structure, Structure
 
 class QDExperiment(object):
     def __init__(self, config_filename, parallelism_type = "sequential", seed = None, base_config = None):
@@ -110,6 +113,11 @@ class QDExperiment(object):
         self.container = self.algo.container
 
         self.batch_mode = self.config.get('batch_mode', False)
+        self.async_mode = self.config.get('async_mode', False)
+        self.max_in_flight = self.config.get('max_in_flight', None)
+        self.checkpoint_period = self.config.get('checkpoint_period', 1)
+        self._nb_checkpoint_calls = 0
+        self.pending = []
         self.log_base_path = self.config['dataDir']
         try:
             self.structure_from = self.config['from_exp']
@@ -118,7 +126,61 @@ class QDExperiment(object):
             self.structure_from = ''
             self.reoptimize = ''
 
-    def run(self):
+    def _checkpoint_path(self):
+        return os.path.join(self.log_base_path, 'checkpoint.p')
+
+    def save_checkpoint(self, pending):
+        """
+        Saves the state of the run (container, algorithms, run counters, RNG states, evaluated structures)
+        every `checkpoint_period` calls. pending: individuals being evaluated, not told yet.
+        The file is replaced atomically, so a crash while saving leaves the previous checkpoint intact.
+        """
+        self._nb_checkpoint_calls += 1
+        if self.checkpoint_period <= 0 or self._nb_checkpoint_calls % self.checkpoint_period != 0:
+            return
+        state = {
+            'container': self.container,
+            'algo': self.algo.get_checkpoint_state(),
+            'run_state': algorithms_base.get_run_state(),
+            'random_state': random.getstate(),
+            'np_random_state': np.random.get_state(),
+            'population_structure_hashes': getattr(self, 'population_structure_hashes', None),
+            # only what is needed to evaluate them again (they may be modified by running evaluations)
+            'pending': [(list(ind), ind.structure.body, ind.structure.connections, ind.structure.shape,
+                         ind.structure.label, ind.structure.generation, ind.structure.parent_label) for ind in pending],
+        }
+        path = self._checkpoint_path()
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    def load_checkpoint(self, path = None):
+        """Restores the state of the run saved by `save_checkpoint`."""
+        path = path if path is not None else self._checkpoint_path()
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        self.container = state['container']
+        self.algo.set_checkpoint_state(state['algo'], self.container)
+        algorithms_base.set_run_state(state['run_state'])
+        random.setstate(state['random_state'])
+        np.random.set_state(state['np_random_state'])
+        if state['population_structure_hashes'] is not None:
+            self.population_structure_hashes.clear()
+            self.population_structure_hashes.update(state['population_structure_hashes'])
+        self.pending = []
+        for values, body, connections, shape, label, generation, *parent_label in state['pending']:
+            ind = Individual(values)
+            ind.structure = Structure(body, connections, label=label, generation=generation, shape=shape)
+            ind.structure.parent_label = parent_label[0] if parent_label else -1     # not in older checkpoints
+            self.pending.append(ind)
+        print(f"Resuming from checkpoint '{path}': {len(self.container)} individuals in the container, {len(self.pending)} evaluations to complete")
+
+    def resume(self, checkpoint_path = None):
+        """Continues a run from its last checkpoint. Evaluations finished before the checkpoint are not run again."""
+        self.load_checkpoint(checkpoint_path)
+        self.run(resume=True)
+
+    def run(self, resume = False):
         # Run illumination process !
         with ParallelismManager(self.parallelism_type) as pMgr:
             try:
@@ -145,7 +207,9 @@ class QDExperiment(object):
                 self.budget = None
 
 
-            best_after_eval, activity_after_eval = self.algo.optimise(self.eval_fn, executor = pMgr.executor, budget=self.budget, batch_mode=self.batch_mode, pop_structure_hashes=history, structures=self.structures)
+            best_after_eval, activity_after_eval = self.algo.optimise(self.eval_fn, executor = pMgr.executor, budget=self.budget, batch_mode=self.batch_mode, pop_structure_hashes=history, structures=self.structures,
+                                                                  async_mode=self.async_mode, max_in_flight=self.max_in_flight,
+                                                                  checkpoint_fn=self.save_checkpoint, resume=resume, pending=self.pending if resume else ())
 
         # Save results
         if isinstance(self.container, Grid):
@@ -15,19 +15,119 @@
 
 """TODO"""
 
+__all__ = ["FeaturesIndex", "features_distances", "novelty", "novelty_nn", "novelty_local_competition"]
+
 import numpy as np
 #from scipy.spatial.distance import euclidean
 #from itertools import starmap
-from typing import Sequence, Callable, Tuple
+from typing import Sequence, Callable, Tuple, Optional, Any
 
 from qdpy.phenotype import *
 from qdpy.base import *
 
 
+########### FEATURES INDEX ########### {{{1
+
+class FeaturesIndex(object):
+    """Matrix of the features of the individuals of a collection (e.g. the depot of an archive), in the same order as the collection.
+    It is maintained incrementally when individuals are appended to or deleted from the collection, and answers batched k-nearest-neighbours queries with vectorized euclidean distances.
+    Results (distances, order of the neighbours, ties broken by position in the collection or by ``tie_keys``) are the same as the ones of ``features_distances`` and of the novelty functions.
+
+    Parameters
+    ----------
+    :param features: Optional[Sequence[FeaturesLike]]
+        Features of the individuals already in the collection.
+    """
+
+    _matrix: np.ndarray
+    _size: int
+
+    def __init__(self, features: Optional[Sequence[FeaturesLike]] = None) -> None:
+        self._matrix = np.empty((0, 0))
+        self._size = 0
+        if features is not None:
+            for f in features:
+                self.append(f)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Return the features of the collection, as an array of shape (len(collection), nb_features)."""
+        return self._matrix[:self._size]
+
+    def append(self, features: FeaturesLike) -> None:
+        """Append ``features`` at the end of the matrix."""
+        values = np.asarray(_values(features), dtype=float)
+        if self._size == 0 and self._matrix.shape[1] != len(values):
+            self._matrix = np.empty((64, len(values)))
+        elif self._matrix.shape[1] != len(values):
+            raise ValueError(f"Features of length {len(values)} cannot be indexed with features of length {self._matrix.shape[1]}.")
+        elif self._size == len(self._matrix):
+            matrix = np.empty((2 * len(self._matrix), len(values)))
+            matrix[:self._size] = self._matrix
+            self._matrix = matrix
+        self._matrix[self._size] = values
+        self._size += 1
+
+    def delete(self, index: int) -> None:
+        """Delete the features at position ``index``, shifting the following ones."""
+        if index < 0:
+            index += self._size
+        self._matrix[index:self._size-1] = self._matrix[index+1:self._size]
+        self._size -= 1
+
+    def clear(self) -> None:
+        self._size = 0
+
+    def distances(self, queries: Any) -> np.ndarray:
+        """Return the euclidean distances between each row of ``queries`` (array-like of shape (Q, nb_features)) and each indexed features, as an array of shape (Q, len(self))."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=float))
+        if self._size == 0:
+            return np.zeros((len(queries), 0))
+        squared = np.zeros((len(queries), self._size))
+        for j in range(queries.shape[1]): # Same summation order as ``features_distances``
+            squared += np.power(queries[:, j, None] - self.matrix[None, :, j], 2.)
+        return np.power(squared, 1./2.)
+
+    def knn(self, queries: Any, k: int, ignore_first: bool = False, tie_keys: Optional[Sequence] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the distances and the positions of the ``k`` nearest neighbours of each row of ``queries``, sorted by increasing distance, as two arrays of shape (Q, min(k, len(self) - ignore_first)).
+        Ties are broken by increasing position or, if ``tie_keys`` (one comparable key per position, e.g. the individuals of the collection) is provided, by increasing key, as ``sorted(zip(distances, tie_keys))`` does.
+        If ``ignore_first`` is True, the nearest neighbour of each query is skipped (e.g. when the query is itself in the collection)."""
+        distances = self.distances(queries)
+        start = 1 if ignore_first else 0
+        stop = min(self._size, k + start)
+        nb = max(stop - start, 0)
+        nn_dists = np.empty((len(distances), nb))
+        nn_idx = np.empty((len(distances), nb), dtype=int)
+        if nb == 0:
+            return nn_dists, nn_idx
+        for q, row in enumerate(distances):
+            # Candidates: every position closer than the ``stop``-th smallest distance, in increasing positions
+            kth = np.partition(row, stop - 1)[stop - 1]
+            candidates = np.flatnonzero(row <= kth)
+            if tie_keys is None:
+                order = candidates[np.argsort(row[candidates], kind="stable")][start:stop]
+            else:
+                order = np.array(sorted(candidates, key=lambda i: (row[i], tie_keys[i]))[start:stop], dtype=int)
+            nn_dists[q] = row[order]
+            nn_idx[q] = order
+        return nn_dists, nn_idx
+
+
+def _values(features: Any) -> Sequence:
+    return features.values if hasattr(features, "values") else features
+
+
 ########### METRICS ########### {{{1
 
 #@jit(nopython=True)
-def features_distances(individual: IndividualLike, container: Sequence, dist: Union[str, Callable] = "euclidean") -> Sequence:
+def features_distances(individual: IndividualLike, container: Sequence, dist: Union[str, Callable] = "euclidean", index: Optional[FeaturesIndex] = None) -> Sequence:
+    """Returns the distances between the features of ``individual`` and the ones of each individual of ``container``.
+    If ``index`` is provided, it must be the ``FeaturesIndex`` of ``container``, and euclidean distances are computed from it."""
+    if index is not None and dist == "euclidean":
+        return index.distances([_values(individual.features)])[0]
     distances = np.zeros(len(container))
     ind_features = individual.features
     if isinstance(dist, str):
@@ -44,12 +144,16 @@ def features_distances(individual: IndividualLike, container: Sequence, dist: Un
             distances[i] = dist(ind_features, ind.features)
     return distances
 
-def novelty(individual: IndividualLike, container: Sequence, k: int = 1, dist: Union[str, Callable] = "euclidean", ignore_first: bool = False, default_novelty: float = 0.1) -> float:
+def novelty(individual: IndividualLike, container: Sequence, k: int = 1, dist: Union[str, Callable] = "euclidean", ignore_first: bool = False, default_novelty: float = 0.1, index: Optional[FeaturesIndex] = None) -> float:
     """Returns the novelty score of ``individual`` in ``container``.
-    Novelty is defined as the average distance to the ``k``-nearest neighbours of ``individual``. If ``container`` is empty, return ``default_novelty``."""
+    Novelty is defined as the average distance to the ``k``-nearest neighbours of ``individual``. If ``container`` is empty, return ``default_novelty``.
+    If ``index`` is provided, it must be the ``FeaturesIndex`` of ``container``, and it is used to find the nearest neighbours."""
     if len(container) == 0:
         return default_novelty
     n_k = min(len(container), k)
+    if index is not None and dist == "euclidean":
+        nn_dists, _ = index.knn([_values(individual.features)], n_k, ignore_first)
+        return np.mean(list(nn_dists[0]))
     distances: Sequence = features_distances(individual, container, dist)
     if ignore_first:
         nearest_neighbours_dists: Sequence = sorted(distances)[1:n_k+1]
@@ -58,13 +162,17 @@ def novelty(individual: IndividualLike, container: Sequence, k: int = 1, dist: U
     return np.mean(nearest_neighbours_dists)
 
 
-def novelty_nn(individual: IndividualLike, container: Sequence, k: int = 1, nn_size: int = 1, dist: Union[str, Callable] = "euclidean", ignore_first: bool = False, default_novelty: float = 0.1) -> Tuple[float, Sequence]:
+def novelty_nn(individual: IndividualLike, container: Sequence, k: int = 1, nn_size: int = 1, dist: Union[str, Callable] = "euclidean", ignore_first: bool = False, default_novelty: float = 0.1, index: Optional[FeaturesIndex] = None) -> Tuple[float, Sequence]:
     """Returns the novelty score of ``individual`` in ``container`` and the indexes of its ``nn_size`` nearest neighbours.
-    Novelty is defined as the average distance to the ``k``-nearest neighbours of ``individual``.  If ``container`` is empty, return ``default_novelty``."""
+    Novelty is defined as the average distance to the ``k``-nearest neighbours of ``individual``.  If ``container`` is empty, return ``default_novelty``.
+    If ``index`` is provided, it must be the ``FeaturesIndex`` of ``container``, and it is used to find the nearest neighbours."""
     if len(container) == 0:
         return default_novelty, []
     n_k = min(len(container), k)
     n_nn_size = min(len(container), nn_size)
+    if index is not None and dist == "euclidean":
+        nn_dists, nn_idx = index.knn([_values(individual.features)], max(n_k, n_nn_size), ignore_first)
+        return np.mean(list(nn_dists[0, :n_k])), tuple(int(i) for i in nn_idx[0, :n_nn_size])
     distances: Sequence = features_distances(individual, container, dist)
     idx_container = list(range(len(container)))
     if ignore_first:
@@ -79,21 +187,28 @@ def novelty_nn(individual: IndividualLike, container: Sequence, k: int = 1, nn_s
     return novelty, nearest_neighbours_idx
 
 
-def novelty_local_competition(individual: IndividualLike, container: Sequence, k: int = 1, dist: Union[str, Callable] = "euclidean", ignore_first: bool = False, default_novelty: float = 0.1, default_local_competition: float = 1.0) -> Tuple[float, float]:
+def novelty_local_competition(individual: IndividualLike, container: Sequence, k: int = 1, dist: Union[str, Callable] = "euclidean", ignore_first: bool = False, default_novelty: float = 0.1, default_local_competition: float = 1.0, index: Optional[FeaturesIndex] = None) -> Tuple[float, float]:
     """Returns the novelty and normalised local competition scores of ``individual`` in ``container``.
     Novelty is defined as the average distance to the ``k``-nearest neighbours of ``individual``.
     Local competition is defined as the number of ``k``-nearest neighbours of ``individual`` that are outperformed by ``individual``. This value is normalised by ``k`` to be in domain [0., 1.].
-    If ``container`` is empty, return ``default_novelty`` and ``default_local_competition``."""
+    If ``container`` is empty, return ``default_novelty`` and ``default_local_competition``.
+    If ``index`` is provided, it must be the ``FeaturesIndex`` of ``container``, and it is used to find the nearest neighbours."""
     if len(container) == 0:
         return default_novelty, default_local_competition
-    distances: Sequence = features_distances(individual, container, dist)
     nearest_neighbours_dists: Sequence
     nearest_neighbours: Sequence
-    if ignore_first:
-        nn: Sequence = sorted(zip(distances, container))[1:k+1]
+    if index is not None and dist == "euclidean":
+        nn_dists, nn_idx = index.knn([_values(individual.features)], k, ignore_first, tie_keys=container)
+        if nn_idx.shape[1] == 0:
+            raise ValueError("No nearest neighbours to compute novelty and local competition.")
+        nearest_neighbours_dists, nearest_neighbours = list(nn_dists[0]), [container[i] for i in nn_idx[0]]
     else:
-        nn = sorted(zip(distances, container))[:k]
-    nearest_neighbours_dists, nearest_neighbours = tuple(zip(*nn))
+        distances: Sequence = features_distances(individual, container, dist)
+        if ignore_first:
+            nn: Sequence = sorted(zip(distances, container))[1:k+1]
+        else:
+            nn = sorted(zip(distances, container))[:k]
+        nearest_neighbours_dists, nearest_neighbours = tuple(zip(*nn))
     novelty: float = np.mean(nearest_neighbours_dists)
     local_competition: float = sum((individual.fitness.dominates(ind.fitness) for ind in nearest_neighbours)) / float(k)
     return novelty, local_competition
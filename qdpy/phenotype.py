@@ -20,7 +20,7 @@
 
 
 ########### IMPORTS ########### {{{1
-from typing import Optional, Tuple, List, Iterable, Iterator, Any, TypeVar, Generic, Union, Sequence, MutableSet, MutableSequence, Type, Callable, Generator, MutableMapping, overload
+from typing import Optional, Tuple, List, Iterable, Iterator, Any, TypeVar, Generic, Union, Sequence, MutableSet, MutableSequence, Type, Callable, Generator, MutableMapping, Hashable, overload
 from typing_extensions import runtime, Protocol
 from operator import mul, truediv
 import math
@@ -50,6 +50,7 @@ FeaturesValuesLike = Union[Sequence[Any], np.ndarray]
 @runtime
 class FitnessLike(Protocol):
     """Fitness protocol inspired from (and compatible with) DEAP Fitness class."""
+    __slots__ = ()
     weights: FitnessValuesLike
     def dominates(self, other: Any, obj: Any = slice(None)) -> bool: ...
     def getValues(self) -> FitnessValuesLike: ...
@@ -74,6 +75,7 @@ class FitnessLike(Protocol):
 @runtime
 class FeaturesLike(Protocol):
     """Features protocol similar to the ``FitnessLike`` protocol."""
+    __slots__ = ()
     def getValues(self) -> FeaturesValuesLike: ...
     def setValues(self, values: FeaturesValuesLike) -> None: ...
     def delValues(self) -> None: ...
@@ -93,6 +95,7 @@ class FeaturesLike(Protocol):
 
 @runtime
 class IndividualLike(Protocol):
+    __slots__ = ()
     name: str
     fitness: FitnessLike
     features: FeaturesLike
@@ -112,14 +115,49 @@ GridIndexLike = ShapeLike
 
 ########### BASE OPTIMISATION CLASSES ########### {{{1
 
-class Fitness(FitnessLike, Sequence[Any]):
-    """Fitness implementation inspired from DEAP Fitness class. It can be used without problem with most (propably all) DEAP methods."""
+ALL_OBJECTIVES = slice(None)
+
+def _get_slots_state(obj: Any) -> MutableMapping[str, Any]:
+    """Return the attributes of ``obj``, stored in its ``__slots__`` or in its ``__dict__``, to pickle and copy it."""
+    state = dict(getattr(obj, "__dict__", {}))
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            if name != "__dict__" and hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    return state
+
+def _set_slots_state(obj: Any, state: Any) -> None:
+    """Restore the attributes of ``obj`` returned by ``_get_slots_state``, or pickled before the class used ``__slots__``."""
+    if isinstance(state, tuple): # (__dict__, slots) state of the default pickling of objects with ``__slots__``
+        state = {**(state[0] or {}), **(state[1] or {})}
+    for name, value in state.items():
+        setattr(obj, name, value)
 
-    weights: FitnessValuesLike = ()
-    wvalues: FitnessValuesLike = ()
 
-    def __new__(cls, values: FitnessValuesLike=(), weights: Optional[FitnessValuesLike]=None):
-        return super(Fitness, cls).__new__(cls)
+class Fitness(FitnessLike, Sequence[Any]):
+    """Fitness implementation inspired from DEAP Fitness class. It can be used without problem with most (propably all) DEAP methods.
+    The unweighted values are cached, and attributes are stored in ``__slots__`` to keep archived individuals small."""
+
+    __slots__ = ("_weights", "_wvalues", "_values")
+    _weights: FitnessValuesLike
+    _wvalues: FitnessValuesLike
+    _values: Optional[FitnessValuesLike]    # cache of the unweighted values
+
+    def __new__(cls, *args, **kwargs):
+        fitness = super(Fitness, cls).__new__(cls)
+        fitness._weights = ()
+        fitness._wvalues = ()
+        fitness._values = None
+        return fitness
+
+    def __getstate__(self) -> MutableMapping[str, Any]:
+        state = _get_slots_state(self)
+        del state["_values"]
+        return state
+
+    def __setstate__(self, state: Any) -> None:
+        self._values = None
+        _set_slots_state(self, state)
 
     def __init__(self, values: FitnessValuesLike=(), weights: Optional[FitnessValuesLike]=None) -> None:
         if weights is None:
@@ -130,9 +168,29 @@ class Fitness(FitnessLike, Sequence[Any]):
             raise ValueError("``values`` and ``weights`` must have the same length.")
         self.values = values
 
+    @property
+    def weights(self) -> FitnessValuesLike:
+        return self._weights
+
+    @weights.setter
+    def weights(self, weights: FitnessValuesLike) -> None:
+        self._weights = weights
+        self._values = None
+
+    @property
+    def wvalues(self) -> FitnessValuesLike:
+        return self._wvalues
+
+    @wvalues.setter
+    def wvalues(self, wvalues: FitnessValuesLike) -> None:
+        self._wvalues = wvalues
+        self._values = None
+
     @property
     def values(self) -> FitnessValuesLike:
-        return tuple(map(truediv, self.wvalues, self.weights))
+        if self._values is None:
+            self._values = tuple(map(truediv, self._wvalues, self._weights))
+        return self._values
 
     @values.setter
     def values(self, values: FitnessValuesLike) -> None:
@@ -155,7 +213,7 @@ class Fitness(FitnessLike, Sequence[Any]):
         del self.values
 
     # FROM DEAP
-    def dominates(self, other: Any, obj: Any = slice(None)) -> bool:
+    def dominates(self, other: Any, obj: Any = ALL_OBJECTIVES) -> bool:
         """Return true if each objective of ``self`` is not strictly worse than
         the corresponding objective of ``other`` and at least one objective is
         strictly better.
@@ -163,8 +221,14 @@ class Fitness(FitnessLike, Sequence[Any]):
 #    :param obj: Slice indicating on which objectives the domination is
 #                tested. The default value is `slice(None)`, representing
 #                every objectives.  """
+        if obj is ALL_OBJECTIVES: # Compare the values in place
+            self_wvalues, other_wvalues = self._wvalues, other.wvalues
+            if len(self_wvalues) == 1 and len(other_wvalues) == 1:
+                return self_wvalues[0] > other_wvalues[0]
+        else:
+            self_wvalues, other_wvalues = self._wvalues[obj], other.wvalues[obj]
         not_equal: bool = False
-        for self_wvalue, other_wvalue in zip(self.wvalues[obj], other.wvalues[obj]):
+        for self_wvalue, other_wvalue in zip(self_wvalues, other_wvalues):
             if self_wvalue > other_wvalue:
                 not_equal = True
             elif self_wvalue < other_wvalue:
@@ -232,11 +296,18 @@ class Fitness(FitnessLike, Sequence[Any]):
 
 
 class Features(FeaturesLike, Sequence[Any]):
+    __slots__ = ("_values",)
     _values: FeaturesValuesLike
 
     def __init__(self, values: FeaturesValuesLike=(), *args, **kwargs) -> None:
         self._values = values
 
+    def __getstate__(self) -> MutableMapping[str, Any]:
+        return _get_slots_state(self)
+
+    def __setstate__(self, state: Any) -> None:
+        _set_slots_state(self, state)
+
     @property
     def values(self) -> FeaturesValuesLike:
         return self._values
@@ -323,12 +394,13 @@ class Features(FeaturesLike, Sequence[Any]):
 class Individual(list, IndividualLike):
     """Qdpy Individual class. Note that containers and algorithms all use internally either the QDPYIndividualLike Protocol or the IndividualWrapper class, so you can easily declare an alternative class to Individual. TODO""" # TODO
 
+    __slots__ = ("name", "fitness", "features", "elapsed", "structure")
     name: str
     fitness: FitnessLike
     features: FeaturesLike
-    elapsed: float = math.nan
+    elapsed: float
 
-    structure: Structure = None                    # structure (defined in algo_utils.py)
+    structure: Structure                    # structure (defined in algo_utils.py)
 
     def __init__(self, iterable: Optional[Iterable] = None,
             name: Optional[str] = None,
@@ -338,6 +410,16 @@ class Individual(list, IndividualLike):
         self.name = name if name else ""
         self.fitness = fitness if fitness is not None else Fitness()
         self.features = features if features is not None else Features([])
+        self.elapsed = math.nan
+        self.structure = None
+
+    def __getstate__(self) -> MutableMapping[str, Any]:
+        return _get_slots_state(self)
+
+    def __setstate__(self, state: Any) -> None:
+        self.elapsed = math.nan
+        self.structure = None
+        _set_slots_state(self, state)
 
     def __repr__(self) -> str:
         if not self:
@@ -348,15 +430,39 @@ class Individual(list, IndividualLike):
         """Return true if ``self`` dominates ``other``. """
         return self.fitness.dominates(other.fitness)
 
+    def clone(self) -> "Individual":
+        """Return a copy of this individual, equivalent to a deepcopy but much cheaper: the genome and the fitness and
+        features values are copied, and the structure is shared once frozen (see ``Structure.freeze``)."""
+        fitness = self.fitness.__class__.__new__(self.fitness.__class__)
+        fitness.weights, fitness.wvalues = self.fitness.weights, self.fitness.wvalues     # tuples
+        ind = self.__class__(self, name=self.name, fitness=fitness, features=self.features.__class__(copy.copy(self.features.values)))
+        ind.elapsed = self.elapsed
+        ind.structure = copy.deepcopy(self.structure)
+        return ind
+
     def set_fitness(self, fitness):
         self.structure.set_reward(fitness)
         self.fitness.values = [self.structure.fitness]
 
+    def set_result(self, result):
+        """Set fitness and evaluation telemetry from the `utils.mp_group.JobResult` of the evaluation job.
+        A failed evaluation gets a NaN fitness, so that containers reject the individual."""
+        self.elapsed = result.elapsed
+        self.structure.eval_info = {**result.info, 'ok': result.ok, 'error': result.error, 'max_rss': result.max_rss}
+        self.set_fitness(result.value if result.ok else math.nan)
+
     def reset(self) -> None:
         self.fitness.reset()
         self.features.reset()
         self.elapsed = math.nan
 
+    def identity_key(self) -> Hashable:
+        """Return the key identifying this individual in the indexes of the containers: the label and body of its robot, or its genome values if it has no labelled structure."""
+        if self.structure is None or self.structure.label < 0:
+            return (self.__class__.__name__, tuple(self))
+        body = np.asarray(self.structure.body)
+        return (self.structure.label, body.shape, body.tobytes())
+
     # TODO : improve performance ! (quick and dirty solution !)
     def __hash__(self):
         return hash(tuple(self))
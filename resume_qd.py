@@ -0,0 +1,10 @@
+from qd.run import resume_qd
+
+if __name__ == '__main__':
+
+    resume_qd(
+        experiment_name = 'test_qd',
+        configFileName = 'conf/test_short.yaml',
+        parallelismType = 'multithreading',
+        num_cores = 12
+    )
@@ -0,0 +1,87 @@
+import os
+import shutil
+import sys
+import types
+
+import numpy as np
+import pytest
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root_dir)
+
+pytest.importorskip('evogym')
+pytest.importorskip('torch')
+
+from qdpy.experiment import QDExperiment
+from qdpy.phenotype import Individual
+from utils.algo_utils import Structure
+from utils.eval_store import EvalStore
+from ppo.arguments import PPOConfig
+import qd.sim as sim
+
+
+class _Algo():
+    def get_checkpoint_state(self):
+        return {}
+
+    def set_checkpoint_state(self, state, container):
+        pass
+
+
+def _experiment(log_base_path):
+    """The attributes of a QDExperiment used by save_checkpoint and load_checkpoint."""
+    exp = types.SimpleNamespace(container=[], algo=_Algo(), population_structure_hashes=None,
+                                checkpoint_period=1, _nb_checkpoint_calls=0, log_base_path=log_base_path)
+    exp._checkpoint_path = lambda: os.path.join(log_base_path, 'checkpoint.p')
+    return exp
+
+
+def test_resume_pending_individual_already_stored(tmp_path):
+    """
+    An individual whose training finished after the last checkpoint is evaluated again when the run
+    is resumed: its store entry points to its own controller, which is reused in place.
+    """
+    experiment_name = f'_test_resume_{os.getpid()}'
+    exp_path = os.path.join(root_dir, 'results', experiment_name)
+    body = np.array([[3, 3, 3], [3, 0, 3], [3, 0, 3]])
+    ind = Individual([0.5])
+    ind.structure = Structure(body, np.zeros((2, 0), dtype=int), label=4, generation=1, shape=body.shape)
+
+    exp = _experiment(str(tmp_path))
+    QDExperiment.save_checkpoint(exp, [ind])
+
+    # the training of ind finishes (and is stored) after the checkpoint
+    config = PPOConfig()
+    store = EvalStore(os.path.join(str(tmp_path), 'eval_store'))
+    save_path = os.path.join(exp_path, 'generation_1', 'ind4')
+    os.makedirs(save_path)
+    with open(os.path.join(save_path, 'controller.pt'), 'wb') as f:
+        f.write(b'controller')
+    args = {**config.asdict(), 'env_name': 'Walker-v0', 'num_episode': 5}
+    store.put(store.key(body, ind.structure.connections, 'Walker-v0', args, config.seed), 1.5,
+              os.path.join(save_path, 'controller.pt'))
+
+    try:
+        QDExperiment.load_checkpoint(exp)
+        assert len(exp.pending) == 1
+        sim.simulate('Walker-v0', exp.pending, experiment_name, 5, eval_store=store, ppo_config=config)
+        assert exp.pending[0].structure.label == 4
+        assert exp.pending[0].structure.reward == 1.5
+        with open(os.path.join(save_path, 'controller.pt'), 'rb') as f:
+            assert f.read() == b'controller'
+    finally:
+        shutil.rmtree(exp_path, ignore_errors=True)
+
+
+def test_resume_pending_individual_parent_label(tmp_path):
+    """The parent label of a pending individual (used to warm start its controller) survives a checkpoint."""
+    body = np.array([[3, 3, 3], [3, 0, 3], [3, 0, 3]])
+    ind = Individual([0.5])
+    ind.structure = Structure(body, np.zeros((2, 0), dtype=int), label=4, generation=1, shape=body.shape)
+    ind.structure.parent_label = 2
+
+    exp = _experiment(str(tmp_path))
+    QDExperiment.save_checkpoint(exp, [ind])
+    QDExperiment.load_checkpoint(exp)
+    assert exp.pending[0].structure.label == 4
+    assert exp.pending[0].structure.parent_label == 2
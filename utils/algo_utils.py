@@ -1,8 +1,9 @@
 import os
+import copy
 import numpy as np
-import pandas as pd
-import math
-from evogym import is_connected, has_actuator, get_full_connectivity, draw, get_uniform
+from evogym import get_full_connectivity, get_uniform
+from utils.results_store import load_results
+from utils.manifest import get_manifest, build_manifest
 
 class Structure():
 
@@ -19,6 +20,37 @@ class Structure():
 
         self.label = label
         self.generation = generation
+        self.parent_label = -1  # label of the individual this one was mutated from
+
+        self.eval_info = {}     # telemetry of the evaluation job (see utils.mp_group.JobResult)
+        self.frozen = False
+
+
+    def freeze(self):
+        """
+        Makes body and connections read-only. A frozen structure is shared (not copied) by deep copies of its individual.
+        """
+        for array in (self.body, self.connections):
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+        self.frozen = True
+
+
+    def __deepcopy__(self, memo):
+        if getattr(self, 'frozen', False):
+            return self
+        copied = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copied
+        for k, v in self.__dict__.items():
+            setattr(copied, k, copy.deepcopy(v, memo))
+        return copied
+
+
+    def __setstate__(self, state):
+        # arrays are unpickled writeable: a frozen structure (e.g. from a checkpoint) is made read-only again
+        self.__dict__.update(state)
+        if getattr(self, 'frozen', False):
+            self.freeze()
 
 
     def compute_fitness(self):
@@ -50,19 +82,81 @@ class TerminationCondition():
         self.max_iters = max_iters
 
 
+def batch_is_connected(bodies):
+    """
+    Vectorized is_connected for a stack of bodies (N, H, W): True where the non empty voxels form
+    a single 4-connected component. Labels are propagated between neighbors until they are stable.
+    """
+    filled = bodies != 0
+    n, h, w = bodies.shape
+    labels = np.where(filled, np.arange(1, h*w+1).reshape(1, h, w), 0)
+    padded = np.zeros((n, h+2, w+2), dtype=labels.dtype)
+    while True:
+        padded[:, 1:-1, 1:-1] = labels
+        neighbors = np.maximum.reduce([labels, padded[:, :-2, 1:-1], padded[:, 2:, 1:-1], padded[:, 1:-1, :-2], padded[:, 1:-1, 2:]])
+        new_labels = np.where(filled, neighbors, 0)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    min_label = np.where(filled, labels, h*w+1).min(axis=(1, 2))
+    return filled.any(axis=(1, 2)) & (labels.max(axis=(1, 2)) == min_label)
+
+
+def batch_has_actuator(bodies):
+    return ((bodies == 3) | (bodies == 4)).any(axis=(1, 2))
+
+
+def mutate_batch(parents, mutation_rate=0.1, num_attempts=50, attempts_per_pass=8):
+    """
+    Mutates a stack of bodies (N, H, W), looking for one valid child (connected, with an actuator) per parent.
+    Each candidate is an independent mutation of its parent: every voxel has mutation_rate chance of
+    being redrawn. attempts_per_pass candidates per parent are drawn and checked at once, until each
+    parent has a valid child or num_attempts candidates were tried. Parents are not modified.
+    Returns the children (N, H, W) and a boolean array, False where no valid child was found.
+    """
+    probs = get_uniform(5)  # probability of sampling each element
+    probs[0] = 0.6 #it is 3X more likely for a cell to become empty
+    probs = probs / probs.sum()
+
+    parents = np.asarray(parents)
+    children = parents.copy()
+    found = np.zeros(len(parents), dtype=bool)
+
+    attempts = 0
+    while attempts < num_attempts and not found.all():
+        todo = np.nonzero(~found)[0]
+        k = min(attempts_per_pass, num_attempts - attempts)
+        candidates = np.repeat(parents[todo], k, axis=0)
+        mutation = np.random.random_sample(candidates.shape) < mutation_rate
+        candidates[mutation] = np.random.choice(5, size=mutation.sum(), p=probs)
+        valid = (batch_is_connected(candidates) & batch_has_actuator(candidates)).reshape(len(todo), k)
+
+        has_valid = valid.any(axis=1)
+        first_valid = valid.argmax(axis=1)
+        for i in np.nonzero(has_valid)[0]:
+            children[todo[i]] = candidates[i*k + first_valid[i]]
+        found[todo[has_valid]] = True
+        attempts += k
+
+    return children, found
+
+
+def mutate_valid(parents, mutation_rate=0.1, num_attempts=50):
+    """
+    Mutates a stack of valid bodies (N, H, W) with mutate_batch, drawing again for the parents without a valid
+    child until each of them has one (a valid child always exists: the parent itself). Returns the children.
+    """
+    children, found = mutate_batch(parents, mutation_rate, num_attempts)
+    while not found.all():
+        todo = np.nonzero(~found)[0]
+        children[todo], found[todo] = mutate_batch(np.asarray(parents)[todo], mutation_rate, num_attempts)
+    return children
+
+
 def mutate(child, shape, mutation_rate=0.1, num_attempts=50):
-    pd = get_uniform(5)  # probability of sampling each element
-    pd[0] = 0.6 #it is 3X more likely for a cell to become empty
-    
-    for n in range(num_attempts): # iterate until valid robot found
-        # for every cell there is mutation_rate% chance of mutation
-        for i in range(shape[0]):
-            for j in range(shape[1]):
-                mutation = [mutation_rate, 1-mutation_rate]
-                if draw(mutation) == 0: # mutation
-                    child[i][j] = draw(pd) 
-        if is_connected(child) and has_actuator(child):
-            return (child, get_full_connectivity(child))
+    children, found = mutate_batch(np.asarray(child)[None], mutation_rate, num_attempts)
+    if found[0]:
+        return (children[0], get_full_connectivity(children[0]))
 
     return None, None # no valid robot found
 
@@ -86,12 +180,14 @@ def pretty_print(list_org, max_name_length=30):
 
 def get_ind_path(label, base_path='results'):
     """
-    Returns the path of individual "ind<label>".
+    Returns the path of individual "ind<label>" of the experiment base_path, from the experiment manifest
+    (None if the individual is not in the experiment).
+    The manifest of an experiment saved without one is built the first time (see index_experiment.py).
     """
-    name = "ind" + str(label)
-    for (root,dirs,files) in os.walk(base_path, topdown=True):
-        if name in dirs:
-            return os.path.join(root, name)
+    manifest = get_manifest(base_path)
+    if not os.path.exists(manifest.file_path):
+        build_manifest(base_path)
+    return manifest.ind_path(label)
 
 
 def find_in_metadata(path, field):
@@ -131,36 +227,23 @@ def get_stored_structure(structure_path):
     structure = tuple(structure)
     return structure
 
-def best_in_exp(exp, n, bounds=[-50, 50]):
+def best_in_exp(exp, n, bounds=[-50, 50], features_domain=[(0., 1.), (0., 1.)], shape=(10, 10)):
     """
     Args:
-        exp:    path of the experiment to get the best individuals from
-        n:      number of top individuals to find (Note: max is the number of cells in the map)
-        bounds: fitness domain mask [optional]
+        exp:                path of the experiment to get the best individuals from
+        n:                  number of top individuals to find (Note: max is the number of cells in the map)
+        bounds:             fitness domain mask [optional]
+        features_domain:    domain of the features of the map [optional]
+        shape:              number of cells of the map in each features dimension [optional]
     Returns:
-        the labels of the best n individuals in exp
+        the labels of the best n individuals in exp: the best of each cell of the map, by decreasing fitness
     """
-    
-    df = pd.read_csv(os.path.join(exp, 'results.csv'), delimiter=';', header=None)  # read results csv
-    df2 = df.sort_values(by=df.columns[3], ascending = False)   # sort by fitness value
-
-    top = {}    # keys: unique floored features, values: ind number
-
-    row_index = 0
-    while len(top) < n and row_index < len(df2.index):
-        row = df2.iloc[row_index]
-        features = ( float(row[2].split(',')[0][1:4]), float(row[2].split(',')[1][1:4]) )
-
-        if features[0] == 1.0:
-            features = (0.9, features[1])
-        if features[1] == 1.0:
-            features = (features[0], 0.9)
-            
-        if features not in top.keys() and row[3]>bounds[0]:
-            top[features] = row[0][3:]
-        row_index += 1
+    from qdpy.containers import grid_elites     # not at module level: qdpy imports this module
 
-    top = list(top.values())
+    df = load_results(exp)
+    features_list = list(df.columns[df.columns.get_loc('generation') + 1:df.columns.get_loc('fitness')])
+    elites = grid_elites(df[features_list[:len(shape)]].to_numpy(), df['fitness'].to_numpy(), features_domain, shape, n=n, min_fitness=bounds[0])
+    top = [str(label) for label in df['label'].to_numpy()[elites]]
 
     print("Found top", len(top), "individuals at", exp)
     return top
\ No newline at end of file
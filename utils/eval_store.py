@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# arguments that don't change the outcome of a training
+IGNORED_ARGS = ['log_interval', 'save_interval', 'log_dir', 'save_dir', 'vec_env']
+
+class EvalStore():
+    """
+    Persistent, content-addressed store of evaluation results, shared between experiments.
+    Each entry is a json file named after the hash of everything that defines the evaluation
+    (body, connections, environment, training arguments, seed), and holds the fitness and
+    the path of the trained controller.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, body, connections, env_name, args, seed):
+        content = {
+            'body': np.asarray(body).astype(int).tolist(),
+            'connections': np.asarray(connections).astype(int).tolist(),
+            'env_name': env_name,
+            'args': {k: v for k, v in args.items() if k not in IGNORED_ARGS},
+            'seed': seed,
+        }
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, key):
+        """
+        Returns the stored entry (dict with 'fitness' and 'controller'), or None if the evaluation
+        was never stored or its controller doesn't exist anymore.
+        """
+        try:
+            with open(self._entry_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is None or not os.path.exists(entry['controller']):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, fitness, controller_path, **info):
+        entry = {'fitness': float(fitness), 'controller': os.path.abspath(controller_path), **info}
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file and rename it: concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
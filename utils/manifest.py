@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+
+MANIFEST = 'manifest.jsonl'
+
+
+class Manifest():
+    """
+    Index of the individuals saved in an experiment: label -> generation, structure path and controller path.
+    It is the file exp_path/manifest.jsonl, one json line per individual, appended as individuals are saved.
+    Paths are relative to the experiment directory.
+    """
+
+    def __init__(self, exp_path):
+        self.exp_path = exp_path
+        self.file_path = os.path.join(exp_path, MANIFEST)
+        self.entries = {}
+        self._offset = 0    # bytes of the file already read
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Reads the lines appended to the file since the last read (by this or another process)."""
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):    # line being written
+                    break
+                entry = json.loads(line)
+                self.entries[entry['label']] = entry
+                self._offset += len(line)
+
+    def add(self, label, generation, ind_path):
+        ind_dir = os.path.relpath(ind_path, self.exp_path)
+        entry = {'label': int(label), 'generation': int(generation),
+                 'structure': os.path.join(ind_dir, 'structure.npz'), 'controller': os.path.join(ind_dir, 'controller.pt')}
+        with self._lock:
+            if self.entries.get(entry['label']) == entry:
+                return
+            self.refresh()
+            with open(self.file_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.refresh()
+
+    def get(self, label):
+        """Returns the entry of the individual (dict with label, generation, structure and controller), or None."""
+        label = int(label)
+        if label not in self.entries:
+            self.refresh()
+        return self.entries.get(label)
+
+    def ind_path(self, label):
+        entry = self.get(label)
+        if entry is None:
+            return None
+        return os.path.dirname(os.path.join(self.exp_path, entry['structure']))
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def build_manifest(exp_path):
+    """
+    Writes the manifest of an experiment saved without one, by looking for the ind<label> directories.
+    Returns the Manifest.
+    """
+    manifest = get_manifest(exp_path)
+    for (root, dirs, files) in os.walk(exp_path, topdown=True):
+        for name in sorted(dirs):
+            if name.startswith('ind') and name[3:].isdigit():
+                generation = os.path.basename(root)[len('generation_'):]
+                if int(name[3:]) not in manifest.entries:
+                    manifest.add(name[3:], generation if generation.isdigit() else -1, os.path.join(root, name))
+    return manifest
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def get_manifest(exp_path):
+    """Returns the Manifest of the experiment, shared by all the callers of the process."""
+    key = os.path.abspath(exp_path)
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = Manifest(exp_path)
+        return _manifests[key]
@@ -1,21 +1,131 @@
+import atexit
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import importlib
 import multiprocessing
+import resource
+import threading
 import time
 import traceback
 
-def job_wrapper(func, args, data_container):
+MAX_POOL_BREAKS = 2     # breaks of the pool a job can be in flight for before being run alone
+
+# modules imported once by each pool worker, so that jobs don't pay for them
+WARM_IMPORTS = ['numpy', 'torch', 'gym', 'evogym', 'evogym.envs', 'ppo.run', 'ppo.run_batch', 'ppo.evaluate']
+
+def _init_worker(modules):
+    for name in modules:
         try:
-            out_value = func(*args)
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+class JobResult():
+    """
+    Outcome of a job, sent back from the worker to the parent.
+    Args:
+        value:      value returned by the job function (0.0 if the job failed)
+        ok:         False if the job raised an exception or its worker died
+        error:      traceback of the failure, if any
+        info:       extra data attached by the job through report()
+        elapsed:    wall time of the job, in seconds
+        max_rss:    peak resident memory of the worker and its children so far, in kB
+    """
+
+    def __init__(self, value=0.0, ok=True, error=None, info=None, elapsed=0.0, max_rss=0):
+        self.value = value
+        self.ok = ok
+        self.error = error
+        self.info = info if info is not None else {}
+        self.elapsed = elapsed
+        self.max_rss = max_rss
+
+    def __repr__(self):
+        status = 'ok' if self.ok else 'failed'
+        return f'JobResult({status}, value={self.value}, elapsed={self.elapsed:.1f}s)'
+
+
+_job_info = None    # info of the job running in this process
+
+def report(**info):
+    """
+    Attaches info to the result of the job running in this process.
+    Does nothing when not called from a job (e.g. when the job function is called directly).
+    """
+    if _job_info is not None:
+        _job_info.update(info)
+
+def _max_rss():
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def job_wrapper(func, args):
+        global _job_info
+        _job_info = {}
+        start_time = time.time()
+        try:
+            result = JobResult(func(*args))
         except:
             print("ERROR\n")
             traceback.print_exc()
             print()
-            return 0   
-        data_container.value = out_value
+            result = JobResult(ok=False, error=traceback.format_exc())
+        result.info, _job_info = _job_info, None
+        result.elapsed = time.time() - start_time
+        result.max_rss = _max_rss()
+        return result
+
+
+class Pool():
+    """
+    Long-lived worker processes shared by all the groups of the parent process.
+    Workers are started once (with WARM_IMPORTS already loaded) and reused for every job.
+    """
+
+    def __init__(self, num_proc, warm_imports=WARM_IMPORTS):
+        self.num_proc = num_proc
+        self.broken = False
+        ctx = multiprocessing.get_context("forkserver")
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_proc, mp_context=ctx,
+                                                               initializer=_init_worker, initargs=(warm_imports,))
+
+    def submit(self, func, args):
+        return self.executor.submit(job_wrapper, func, args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(num_proc):
+    """
+    Returns the shared pool, (re)creating it if it is missing, broken or too small for num_proc jobs.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and (_pool.broken or _pool.num_proc < num_proc):
+            _pool.shutdown()
+            _pool = None
+        if _pool is None:
+            _pool = Pool(num_proc)
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+atexit.register(shutdown_pool)
+
 
 class Group():
 
     def __init__(self):
-        
+
         self.jobs = []
         self.return_data = []
         self.callback = []
@@ -23,42 +133,68 @@ class Group():
 
     def add_job(self, func, args, callback):
 
-        self.return_data.append(multiprocessing.Value("d", 0.0))
-        self.jobs.append(multiprocessing.Process(target=job_wrapper, args=(func, args, self.return_data[-1])))
+        self.jobs.append((func, args))
+        self.return_data.append(JobResult(ok=False, error='not run'))
         self.callback.append(callback)
 
     def run_jobs(self, num_proc):
-        
-        next_job = 0
-        num_jobs_open = 0
-        jobs_finished = 0
-
-        jobs_open = set()
-
-        while(jobs_finished != len(self.jobs)):
-
-            jobs_closed = []
-            for job_index in jobs_open:
-                if not self.jobs[job_index].is_alive():
-                    self.jobs[job_index].join()
-                    self.jobs[job_index].terminate()
-                    num_jobs_open -= 1
-                    jobs_finished += 1
-                    jobs_closed.append(job_index)
-
-            for job_index in jobs_closed:
-                jobs_open.remove(job_index)
-
-            while(num_jobs_open < num_proc and next_job != len(self.jobs)):
-                self.jobs[next_job].start()
-                jobs_open.add(next_job)
-                next_job += 1
-                num_jobs_open += 1
-
-            time.sleep(0.1)
-
-        for i in range(len(self.jobs)):
-            self.callback[i](self.return_data[i].value)
-
-
-
+        """
+        Runs the jobs on the shared pool, with at most num_proc of them at the same time.
+        Callbacks are called in the parent with the JobResult of each job, as soon as it completes.
+        A worker that dies breaks the pool: all the jobs in flight fail with it, but only the one
+        that killed it is to blame. They are run again on a new pool, and the ones that were in flight
+        at MAX_POOL_BREAKS breaks are then run alone, so that only a job breaking the pool by itself fails.
+        """
+        pool = get_pool(num_proc)
+
+        queue = collections.deque(range(len(self.jobs)))
+        breaks = [0] * len(self.jobs)   # breaks of the pool each job was in flight for
+        jobs_open = {}  # future -> (job index, pool running it)
+
+        def isolated(job_index):
+            return breaks[job_index] >= MAX_POOL_BREAKS
+
+        while len(queue) > 0 or len(jobs_open) > 0:
+
+            while len(jobs_open) < num_proc and len(queue) > 0 and not any(isolated(i) for i, _ in jobs_open.values()):
+                if isolated(queue[0]) and len(jobs_open) > 0:
+                    break
+                job_index = queue.popleft()
+                func, args = self.jobs[job_index]
+                try:
+                    future = pool.submit(func, args)
+                except (BrokenProcessPool, RuntimeError):
+                    # the shared pool was broken or shut down (e.g. by a group running in another thread)
+                    pool.broken = True
+                    pool = get_pool(num_proc)
+                    future = pool.submit(func, args)
+                jobs_open[future] = (job_index, pool)
+
+            # wake up as soon as any job is finished
+            jobs_closed, _ = concurrent.futures.wait(jobs_open, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in jobs_closed:
+                job_index, job_pool = jobs_open.pop(future)
+                try:
+                    self.return_data[job_index] = future.result()
+                except BrokenProcessPool:
+                    job_pool.broken = True
+                    if not isolated(job_index):
+                        breaks[job_index] += 1
+                        # run again: alone (after the others) if it was in flight at too many breaks
+                        if isolated(job_index):
+                            queue.append(job_index)
+                        else:
+                            queue.appendleft(job_index)
+                        continue
+                    print("ERROR\nworker process died while running job", job_index, "\n")
+                    self.return_data[job_index] = JobResult(ok=False, error='worker process died')
+                except Exception:
+                    # e.g. the function or its arguments could not be pickled for the worker
+                    print("ERROR\njob", job_index, "could not be run\n")
+                    traceback.print_exc()
+                    self.return_data[job_index] = JobResult(ok=False, error=traceback.format_exc())
+                self.callback[job_index](self.return_data[job_index])
+
+            if pool.broken:
+                pool = get_pool(num_proc)
@@ -0,0 +1,111 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tables     # HDF5 backend of pandas
+    HAS_HDF5 = True
+except ImportError:
+    HAS_HDF5 = False
+
+RESULTS_HDF5 = 'results.h5'
+RESULTS_TABLE_CSV = 'results_table.csv'   # same columns, used when PyTables is not installed
+RESULTS_CSV = 'results.csv'               # legacy format: ind{label};generation{g};{features};{fitness}
+HDF5_KEY = 'results'
+
+_lock = threading.Lock()    # evaluations of the same run can be stored from several threads
+
+
+class ResultsStore():
+    """
+    Append-only table of the evaluated individuals of an experiment, one row per individual:
+    label, generation, one column per feature, fitness, elapsed (training time, in seconds),
+    ok (False if the training failed) and the body, one int8 column per voxel (body_{row}_{col}).
+    Rows are appended to results.h5 (HDF5 table, readable in chunks and queryable with where=),
+    or to results_table.csv if PyTables is not installed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, individuals, features_list):
+        df = results_frame(individuals, features_list)
+        if len(df) == 0:
+            return
+        with _lock:
+            if HAS_HDF5:
+                df.to_hdf(os.path.join(self.path, RESULTS_HDF5), key=HDF5_KEY, mode='a', format='table', append=True,
+                          index=False, data_columns=['label', 'generation', 'fitness', *features_list])
+            else:
+                file_path = os.path.join(self.path, RESULTS_TABLE_CSV)
+                df.to_csv(file_path, mode='a', index=False, header=not os.path.exists(file_path))
+
+
+def results_frame(individuals, features_list):
+    """
+    Returns the rows of the evaluated individuals, with the columns of ResultsStore.
+    """
+    rows = []
+    for ind in individuals:
+        row = {'label': ind.structure.label, 'generation': ind.structure.generation}
+        row.update(zip(features_list, ind.features))
+        row['fitness'] = ind.fitness[0]
+        row['elapsed'] = ind.elapsed
+        row['ok'] = bool(getattr(ind.structure, 'eval_info', {}).get('ok', True))
+        body = np.asarray(ind.structure.body)
+        row.update({f'body_{i}_{j}': body[i, j] for i in range(body.shape[0]) for j in range(body.shape[1])})
+        rows.append(row)
+
+    df = pd.DataFrame(rows)
+    if len(df) == 0:
+        return df
+    return df.astype({'label': np.int64, 'generation': np.int64, 'fitness': np.float64, 'elapsed': np.float64,
+                      'ok': bool, **{c: np.int8 for c in body_columns(df)}})
+
+
+def load_results(exp, features_list=None, where=None):
+    """
+    Args:
+        exp:            path of the experiment
+        features_list:  names of the features, only used to read a legacy results.csv (default: feature_0, feature_1, ...)
+        where:          query on the label, generation, fitness and features columns, e.g. 'fitness > 0' [optional]
+    Returns:
+        the DataFrame of the evaluated individuals of exp, with the columns of ResultsStore
+        (no elapsed, ok and body columns when read from a legacy results.csv)
+    """
+    if os.path.exists(os.path.join(exp, RESULTS_HDF5)):
+        return pd.read_hdf(os.path.join(exp, RESULTS_HDF5), key=HDF5_KEY, where=where)
+
+    if os.path.exists(os.path.join(exp, RESULTS_TABLE_CSV)):
+        df = pd.read_csv(os.path.join(exp, RESULTS_TABLE_CSV), float_precision='round_trip')
+        df = df.astype({c: np.int8 for c in body_columns(df)})
+    else:
+        df = _read_legacy_csv(os.path.join(exp, RESULTS_CSV), features_list)
+    return df.query(where) if where is not None else df
+
+
+def _read_legacy_csv(file_path, features_list=None):
+    legacy = pd.read_csv(file_path, delimiter=';', header=None, float_precision='round_trip')
+    features = legacy[2].str.strip('[]').str.split(',', expand=True).astype(np.float64)
+    if features_list is None:
+        features_list = [f'feature_{i}' for i in range(features.shape[1])]
+    df = pd.DataFrame({'label': legacy[0].str[len('ind'):].astype(np.int64),
+                       'generation': legacy[1].str[len('generation'):].astype(np.int64)})
+    for i, name in enumerate(features_list):
+        df[name] = features[i]
+    df['fitness'] = legacy[3].astype(np.float64)
+    return df
+
+
+def body_columns(df):
+    return [c for c in df.columns if c.startswith('body_')]
+
+def results_bodies(df):
+    """
+    Returns the bodies of the rows of df, as an int array of shape (len(df), rows, cols).
+    """
+    columns = body_columns(df)
+    shape = (max(int(c.split('_')[1]) for c in columns) + 1, max(int(c.split('_')[2]) for c in columns) + 1)
+    return df[columns].to_numpy(dtype=int).reshape((len(df),) + shape)